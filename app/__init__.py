@@ -1,99 +1,156 @@
-from flask import Flask, request, jsonify
-from flask_cors import CORS
+from flask import Flask, request, g, make_response
+import atexit
 import logging
+import queue
 import sys
-from .main import main_bp
-from .userPortal.documents import upload_bp
-from .userPortal.careerTools.resumeAnalyze import resume_analyze_bp
-from .userPortal.careerTools.coverLetter import cover_letter_bp
-from .userPortal.careerTools.linkedinOptimizer import linkedin_optimizer_bp
-from .userPortal.subscription import subscription_bp
-from .auth import auth_bp
-from .extensions import init_supabase
-from .secrets import get_secret
+import time
+from logging.handlers import QueueHandler, QueueListener
+from .extensions import init_compress, init_supabase
+from .json_provider import OrjsonProvider
+from .secrets import get_secrets
 import re
-from .userPortal.applications.jobListing import job_listing_bp
+
+# Allow requests from all Vercel preview deployments, localhost, and custom domains.
+# Compiled once at import so the per-response check is a set lookup or a precompiled match.
+_ALLOWED_ORIGINS = frozenset({
+    "https://prepzo.ai",
+    "https://www.prepzo.ai",
+    "https://dashboard.prepzo.ai",
+})
+_ALLOWED_ORIGIN_PATTERNS = tuple(re.compile(pattern) for pattern in (
+    r"https://prepzo-client-.*\.vercel\.app",
+    r"http://localhost:.*",
+))
+
+# Headers that are identical on every response, applied with a single headers.extend().
+_STATIC_CORS_HEADERS = (
+    ('Access-Control-Allow-Credentials', 'true'),
+    ('Access-Control-Allow-Headers', 'Content-Type, Authorization, X-Requested-With'),
+    ('Access-Control-Allow-Methods', 'GET, POST, OPTIONS, PUT, PATCH, DELETE'),
+)
+
+# Request bodies larger than this (or without a Content-Length) are not previewed in the logs.
+_MAX_LOGGED_BODY_BYTES = 4096
+
+# Load balancer / liveness probe endpoints; logging them is pure noise.
+_SKIP_LOG_PATHS = frozenset({'/health', '/'})
+
+
+def _match_origin(origin):
+    """Returns the origin if it is allowed to make credentialed requests, else None."""
+    if not origin:
+        return None
+    if origin in _ALLOWED_ORIGINS:
+        return origin
+    for pattern in _ALLOWED_ORIGIN_PATTERNS:
+        if pattern.fullmatch(origin):
+            return origin
+    return None
+
+def _register_blueprints(app):
+    # Blueprints (and their stripe/magic/requests dependencies) are imported here rather
+    # than at module level, so importing the package alone stays cheap.
+    from .main import main_bp
+    from .userPortal.documents import upload_bp
+    from .userPortal.careerTools.resumeAnalyze import resume_analyze_bp
+    from .userPortal.careerTools.coverLetter import cover_letter_bp
+    from .userPortal.careerTools.linkedinOptimizer import linkedin_optimizer_bp
+    from .userPortal.subscription import subscription_bp
+    from .auth import auth_bp
+    from .userPortal.applications.jobListing import job_listing_bp
+
+    app.register_blueprint(main_bp)
+    app.register_blueprint(upload_bp)
+    app.register_blueprint(resume_analyze_bp)
+    app.register_blueprint(cover_letter_bp)
+    app.register_blueprint(linkedin_optimizer_bp)
+    app.register_blueprint(subscription_bp)
+    app.register_blueprint(auth_bp)
+    app.register_blueprint(job_listing_bp)
+
+def _raw_body_preview():
+    # Slice the bytes before decoding so only the previewed prefix is turned into a str.
+    return request.get_data(cache=True, parse_form_data=False)[:500].decode('utf-8', errors='replace')
 
 def create_app():
     app = Flask(__name__)
+    app.json = OrjsonProvider(app)
 
-    secret_name = "userPortal"
+    # Secrets are merged in order; add further names here to load them in one batch call.
+    secret_names = ("userPortal",)
     region_name = "us-east-1"
-    secrets = get_secret(secret_name, region_name)
+    secrets = get_secrets(secret_names, region_name)
     if secrets:
-        for key, value in secrets.items():
-            app.config[key] = value
+        app.config.update(secrets)
     
-     # Centralized CORS Configuration - Now handled by custom middleware
-    CORS(app,
-         supports_credentials=True)
-
     # Logging setup
+    # Request threads only enqueue records; a background listener owns the stdout write.
     app.logger.handlers.clear()
     app.logger.setLevel(logging.INFO) 
     stream_handler = logging.StreamHandler(sys.stdout) 
     formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
     stream_handler.setFormatter(formatter)
-    app.logger.addHandler(stream_handler)
+    log_queue = queue.SimpleQueue()
+    app.logger.addHandler(QueueHandler(log_queue))
+    log_listener = QueueListener(log_queue, stream_handler)
+    log_listener.start()
+    atexit.register(log_listener.stop)
 
     init_supabase(app)  # Initializes Supabase client with app config
+    init_compress(app)
 
-    @app.after_request
-    def after_request_func(response):
-        # Allow requests from all Vercel preview deployments, localhost, and custom domains
-        allowed_origins_regex = [
-            r"https://prepzo-client-.*\.vercel\.app",
-            r"http://localhost:.*",
-            "https://prepzo.ai",
-            "https://www.prepzo.ai",
-            "https://dashboard.prepzo.ai",
-        ]
-        
-        origin = request.headers.get('Origin')
-        if origin:
-            for pattern in allowed_origins_regex:
-                if re.fullmatch(pattern, origin):
-                    response.headers['Access-Control-Allow-Origin'] = origin
-                    break
-        
-        response.headers['Access-Control-Allow-Credentials'] = 'true'
-        response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization, X-Requested-With'
-        response.headers['Access-Control-Allow-Methods'] = 'GET, POST, OPTIONS, PUT, PATCH, DELETE'
-        
-        # Handle preflight (OPTIONS) requests
+    @app.before_request
+    def start_request_timer():
+        g._t0 = time.perf_counter_ns()
+
+    @app.before_request
+    def resolve_cors_origin():
+        g._cors_origin = _match_origin(request.headers.get('Origin'))
+
+    @app.before_request
+    def handle_preflight():
+        # Answer CORS preflights here, before body logging and blueprint dispatch
+        # (auth, feature metering). The after_request hook adds the CORS headers.
         if request.method == 'OPTIONS':
-            response.status_code = 200 # OK
-        
-        return response
+            return make_response('', 204)
 
     @app.before_request
     def log_request_info():
-        app.logger.info(f"Incoming Request: {request.method} {request.path}")
-        if request.data and request.content_type != 'multipart/form-data': 
-            try:
-                if request.content_type == 'application/json':
-                    body_preview = str(request.get_json(silent=True) or request.data.decode('utf-8', errors='replace'))[:500]
-                    app.logger.info(f"Request Body (JSON): {body_preview}")
-                elif request.form:
-                     app.logger.info(f"Request Form Data: {request.form}")
-                else:
-                    body_preview = str(request.data[:500])
-                    app.logger.info(f"Request Body (Preview): {body_preview}")
-            except Exception as e:
-                app.logger.warning(f"Could not parse/log request body: {e}")
+        if request.path in _SKIP_LOG_PATHS or not app.logger.isEnabledFor(logging.INFO):
+            return
+
+        # Only preview small bodies; uploads and unknown-length streams are never buffered here.
+        content_length = request.content_length
+        if not content_length or content_length > _MAX_LOGGED_BODY_BYTES:
+            return
+        try:
+            if request.content_type == 'application/json':
+                # get_json caches the parsed body on the request, so the view does not parse it again.
+                parsed = request.get_json(silent=True)
+                body_preview = str(parsed)[:500] if parsed else _raw_body_preview()
+                app.logger.info("Request Body (JSON): %s", body_preview)
+            elif request.form:
+                app.logger.info("Request Form Data: %d field(s)", len(request.form))
+            else:
+                app.logger.info("Request Body (Preview): %s", _raw_body_preview())
+        except Exception as e:
+            app.logger.warning("Could not parse/log request body: %s", e)
 
     @app.after_request
-    def log_response_info(response):
-        app.logger.info(f"Outgoing Response: {request.method} {request.path} - Status {response.status_code}")
-        # The custom @app.after_request handles CORS headers now, so we can remove the log here.
+    def after_request_func(response):
+        cors_origin = g.get('_cors_origin')
+        if cors_origin:
+            response.headers['Access-Control-Allow-Origin'] = cors_origin
+            # The header echoes the request's origin, so caches must not reuse it across origins.
+            response.vary.add('Origin')
+
+        response.headers.extend(_STATIC_CORS_HEADERS)
+
+        if request.path not in _SKIP_LOG_PATHS and app.logger.isEnabledFor(logging.INFO):
+            t0 = g.get('_t0')
+            duration_ms = (time.perf_counter_ns() - t0) / 1e6 if t0 is not None else -1.0
+            app.logger.info("%s %s -> %d in %.2fms", request.method, request.path, response.status_code, duration_ms)
         return response
 
-    app.register_blueprint(main_bp)
-    app.register_blueprint(upload_bp)
-    app.register_blueprint(resume_analyze_bp)
-    app.register_blueprint(cover_letter_bp)
-    app.register_blueprint(linkedin_optimizer_bp)
-    app.register_blueprint(subscription_bp)
-    app.register_blueprint(auth_bp)
-    app.register_blueprint(job_listing_bp)
+    _register_blueprints(app)
     return app
\ No newline at end of file
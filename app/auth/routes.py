@@ -1,9 +1,94 @@
 from flask import jsonify, g, current_app
+import threading
+from cachetools import TTLCache
 from app.userPortal.subscription.helpers import require_authentication, get_last_day_of_month
+from app.background import run_in_background
 from . import auth_bp
-from app import extensions
 from datetime import date
 
+# The 'Free' plan row is static reference data, so its id is cached after the first lookup.
+_FREE_PLAN_ID = None
+
+def _get_free_plan_id(supabase):
+    global _FREE_PLAN_ID
+    if _FREE_PLAN_ID is None:
+        free_plan_res = supabase.table('subscription_plans').select('id').eq('name', 'Free').single().execute()
+        if free_plan_res.data:
+            _FREE_PLAN_ID = free_plan_res.data['id']
+    return _FREE_PLAN_ID
+
+# Users known to have (or being backfilled with) a subscription row, so repeat
+# /me calls skip the lookup. Subscriptions are never removed, so a long TTL only
+# bounds memory.
+_SUBSCRIBED_USERS = TTLCache(maxsize=20_000, ttl=3600)
+_SUBSCRIBED_USERS_LOCK = threading.Lock()
+
+def _unmark_subscribed(uid):
+    with _SUBSCRIBED_USERS_LOCK:
+        _SUBSCRIBED_USERS.pop(uid, None)
+
+def _claim_backfill(supabase, uid):
+    """
+    Returns True if the user has no user_subscriptions row yet and this caller is the
+    first in the process to notice, so concurrent /me calls schedule a single backfill.
+    """
+    with _SUBSCRIBED_USERS_LOCK:
+        if uid in _SUBSCRIBED_USERS:
+            return False
+    sub_res = supabase.table('user_subscriptions').select('user_id').eq('user_id', uid).limit(1).execute()
+    with _SUBSCRIBED_USERS_LOCK:
+        if uid in _SUBSCRIBED_USERS:
+            return False
+        _SUBSCRIBED_USERS[uid] = True
+    return not sub_res.data
+
+def _backfill_free_subscription(uid, display_name):
+    """
+    Creates Free-plan subscription and usage records for existing users who predate
+    the DB trigger. Scheduled by /me only after its lookup found no subscription, and
+    runs on the background pool so /me does not wait on these writes.
+    """
+    supabase = current_app.extensions["supabase"]
+    subscription_created = False
+
+    try:
+        period_start = date.today().replace(day=1)
+        period_end = get_last_day_of_month(date.today())
+
+        # Use the same logic as the DB trigger to create records, relying on DB defaults
+        # for plan_id, status, and started_at.
+        supabase.table('user_subscriptions').insert({
+            'user_id': uid,
+            'display_name': display_name,
+            'current_period_start': period_start.isoformat(),
+            'current_period_end': period_end.isoformat(),
+        }, returning="minimal").execute()
+        subscription_created = True
+
+        current_app.logger.info("No subscription found for user %s. Backfilled with free plan.", uid)
+
+        free_plan_id = _get_free_plan_id(supabase)
+
+        if free_plan_id is not None:
+            # Also rely on DB defaults for feature counts.
+            supabase.table('feature_usage').insert({
+                'user_id': uid,
+                'plan_id': free_plan_id,
+                'display_name': display_name,
+                'period_start': period_start.isoformat(),
+                'period_end': period_end.isoformat(),
+            }).execute()
+            current_app.logger.info("Successfully backfilled subscription for user %s.", uid)
+        else:
+            current_app.logger.error("Could not backfill usage for user %s: 'Free' plan not found in DB.", uid)
+
+    except Exception as e:
+        # Let a later /me retry if the subscription row was not created.
+        if not subscription_created:
+            _unmark_subscribed(uid)
+        # Log the error only. The profile response has already been returned.
+        current_app.logger.error("An error occurred during subscription backfill for user %s: %s", uid, e, exc_info=True)
+
 @auth_bp.route('/me', methods=['GET'])
 @require_authentication
 def get_user_profile():
@@ -11,54 +96,21 @@ def get_user_profile():
     Returns the profile information of the currently authenticated user.
     This provides a secure way for the frontend to get user details
     without directly querying the database.
-    It also backfills subscription data for existing users who may not have it.
+    It also backfills subscription data for existing users who may not have it:
+    the subscription lookup runs once per user per process, and the backfill itself
+    runs in the background and does not delay the response.
     """
     user = g.user
-    supabase = extensions.supabase
-    uid = user.id
 
+    # Correctly get the display name from the authenticated user object
+    display_name = user.user_metadata.get('full_name') or user.user_metadata.get('name', 'N/A')
     try:
-        # Check if a subscription already exists for this user.
-        sub_res = supabase.table('user_subscriptions').select('user_id', count='exact').eq('user_id', uid).execute()
-
-        # If no subscription is found (count is 0), this is an existing user who needs to be backfilled.
-        if sub_res.count == 0:
-            current_app.logger.info(f"No subscription found for user {uid}. Backfilling with free plan.")
-            
-            free_plan_res = supabase.table('subscription_plans').select('id, name').eq('name', 'Free').single().execute()
-            
-            if free_plan_res.data:
-                free_plan = free_plan_res.data
-                period_start = date.today().replace(day=1)
-                period_end = get_last_day_of_month(date.today())
-
-                # Correctly get the display name from the authenticated user object
-                display_name = g.user.user_metadata.get('full_name') or g.user.user_metadata.get('name', 'N/A')
-
-                # Use the same logic as the DB trigger to create records, relying on DB defaults
-                # for plan_id, status, and started_at.
-                supabase.table('user_subscriptions').insert({
-                    'user_id': uid,
-                    'display_name': display_name,
-                    'current_period_start': period_start.isoformat(),
-                    'current_period_end': period_end.isoformat(),
-                }).execute()
-
-                # Also rely on DB defaults for feature counts.
-                supabase.table('feature_usage').insert({
-                    'user_id': uid,
-                    'plan_id': free_plan['id'],
-                    'display_name': display_name,
-                    'period_start': period_start.isoformat(),
-                    'period_end': period_end.isoformat(),
-                }).execute()
-                current_app.logger.info(f"Successfully backfilled subscription for user {uid}.")
-            else:
-                current_app.logger.error(f"Could not backfill user {uid}: 'Free' plan not found in DB.")
-    
+        if _claim_backfill(current_app.extensions["supabase"], user.id):
+            if run_in_background(_backfill_free_subscription, user.id, display_name) is None:
+                _unmark_subscribed(user.id)
     except Exception as e:
         # Log the error but do not fail the request. The main goal is to return profile data.
-        current_app.logger.error(f"An error occurred during subscription backfill for user {uid}: {e}", exc_info=True)
+        current_app.logger.error("Subscription lookup failed for user %s: %s", user.id, e, exc_info=True)
     
     # Extract relevant, safe-to-share user information
     profile_data = {
@@ -68,4 +120,4 @@ def get_user_profile():
         'avatar_url': user.user_metadata.get('avatar_url') or user.user_metadata.get('picture'),
     }
     
-    return jsonify(profile_data), 200 
\ No newline at end of file
+    return jsonify(profile_data), 200
\ No newline at end of file
@@ -0,0 +1,158 @@
+import atexit
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from postgrest.exceptions import APIError
+
+# Process-wide pool for work whose result the HTTP response does not depend on
+# (backfills, audit inserts). Pending tasks are drained on interpreter exit.
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="background")
+atexit.register(_executor.shutdown, wait=True)
+
+# Caps queued + running tasks so a stalled upstream cannot grow the executor's
+# unbounded work queue without limit; submissions beyond it are dropped and logged.
+_MAX_PENDING = 256
+_pending = threading.BoundedSemaphore(_MAX_PENDING)
+
+def run_in_background(fn, *args, **kwargs):
+    """
+    Runs fn(*args, **kwargs) on the background pool inside an app context of the
+    calling application, so it can use current_app.logger and current_app.extensions.
+    Exceptions are logged and never propagate to the request that submitted the task.
+    Returns the Future, or None if the task was dropped because the pool is saturated.
+    """
+    app = current_app._get_current_object()
+
+    if not _pending.acquire(blocking=False):
+        app.logger.error("Background pool saturated (%d pending); dropped task %s.", _MAX_PENDING, fn.__name__)
+        return None
+
+    def task():
+        try:
+            with app.app_context():
+                try:
+                    return fn(*args, **kwargs)
+                except Exception as e:
+                    app.logger.error("Background task %s failed: %s", fn.__name__, e, exc_info=True)
+        finally:
+            _pending.release()
+
+    try:
+        return _executor.submit(task)
+    except RuntimeError:
+        # Interpreter shutdown: the executor no longer accepts work.
+        _pending.release()
+        app.logger.error("Background pool shut down; dropped task %s.", fn.__name__)
+        return None
+
+
+class BatchInserter:
+    """
+    Coalesces single-row inserts into one table into multi-row Supabase inserts.
+    put() enqueues a row; a daemon thread flushes up to max_batch rows at a time,
+    waiting at most max_wait seconds after the first row of a batch. If PostgREST
+    rejects a batch, its rows are retried one by one so one bad row cannot drop the rest.
+    on_insert, if given, is called with the list of rows once they are stored
+    (e.g. to evict read caches that would otherwise miss them).
+    """
+
+    def __init__(self, table, max_batch=100, max_wait=0.25, max_queue=1000, on_insert=None):
+        self._table = table
+        self._on_insert = on_insert
+        self._max_batch = max_batch
+        self._max_wait = max_wait
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def put(self, row):
+        app = current_app._get_current_object()
+        self._ensure_started(app)
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            app.logger.error("Insert queue for %s is full; dropped a row.", self._table)
+
+    def _ensure_started(self, app):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, args=(app,), name=f"batch-insert-{self._table}", daemon=True
+                )
+                self._thread.start()
+                atexit.register(self._stop)
+
+    def _stop(self):
+        # Wake the writer with a sentinel so rows still queued are flushed before exit.
+        try:
+            self._queue.put(None, timeout=10)
+        except queue.Full:
+            return
+        self._thread.join(timeout=10)
+
+    def _run(self, app):
+        while True:
+            row = self._queue.get()
+            if row is None:
+                return
+            batch = [row]
+            deadline = time.monotonic() + self._max_wait
+            stopping = False
+            while len(batch) < self._max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    row = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if row is None:
+                    stopping = True
+                    break
+                batch.append(row)
+            with app.app_context():
+                self._flush(app, batch)
+            if stopping:
+                return
+
+    def _flush(self, app, batch):
+        supabase = app.extensions["supabase"]
+        # Nothing reads the rows back, and they carry large jsonb columns, so don't
+        # have PostgREST return them. A failed insert raises instead.
+        try:
+            supabase.table(self._table).insert(batch, returning="minimal").execute()
+            self._notify(app, batch)
+            return
+        except APIError as e:
+            # PostgREST rejected the whole statement, so nothing was written.
+            if len(batch) == 1:
+                app.logger.error("Error inserting into %s table: %s", self._table, e, exc_info=True)
+                return
+            app.logger.warning("Batch insert of %d rows into %s failed (%s); retrying individually.", len(batch), self._table, e)
+        except Exception as e:
+            # Transport errors and timeouts leave the outcome unknown; the batch may have
+            # committed, so retrying row by row could write every row twice.
+            app.logger.error("Batch insert of %d rows into %s had an unknown outcome: %s", len(batch), self._table, e, exc_info=True)
+            self._notify(app, batch)
+            return
+        inserted = []
+        for row in batch:
+            try:
+                supabase.table(self._table).insert(row, returning="minimal").execute()
+                inserted.append(row)
+            except Exception as e:
+                app.logger.error("Error inserting into %s table: %s", self._table, e, exc_info=True)
+        if inserted:
+            self._notify(app, inserted)
+
+    def _notify(self, app, rows):
+        if self._on_insert is None:
+            return
+        try:
+            self._on_insert(rows)
+        except Exception as e:
+            app.logger.error("on_insert callback for %s failed: %s", self._table, e, exc_info=True)
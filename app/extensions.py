@@ -1,11 +1,30 @@
-import sys
 import logging
+from flask_compress import Compress
 from supabase import create_client, ClientOptions
 
-supabase = None
+compress = Compress()
+
+# Seconds allowed for each Supabase database and storage request.
+_SUPABASE_CLIENT_TIMEOUT = 10
+
+def init_compress(app):
+    """
+    Enables Brotli/gzip compression of JSON responses (notably the large TheirStack
+    job-search results). Values already present in app.config take precedence.
+    """
+    app.config.setdefault("COMPRESS_MIMETYPES", ["application/json"])
+    app.config.setdefault("COMPRESS_ALGORITHM", ["br", "gzip"])
+    app.config.setdefault("COMPRESS_LEVEL", 4)
+    app.config.setdefault("COMPRESS_BR_LEVEL", 4)
+    app.config.setdefault("COMPRESS_MIN_SIZE", 1024)
+    compress.init_app(app)
 
 def init_supabase(app):
-    global supabase
+    """
+    Creates the Supabase client and stores it in app.extensions["supabase"].
+    Request handlers read it from current_app.extensions once at function entry.
+    """
+    supabase = None
     logger = app.logger if hasattr(app, "logger") else logging.getLogger("supabase")
 
     SUPABASE_URL = app.config.get("SUPABASE_URL")
@@ -15,14 +34,18 @@ def init_supabase(app):
         logger.error(
             "Error: SUPABASE_URL or SUPABASE_SERVICE_ROLE_KEY is missing. Supabase client NOT initialized."
         )
+        app.extensions["supabase"] = None
         return
 
     try:
         logger.info(f"Initializing Supabase client for URL: {SUPABASE_URL}")
 
-        # Set timeouts using ClientOptions (only accepted ones)
+        # Each sub-client builds its own pooled HTTP/2 httpx client from these timeouts.
+        # Don't pass one shared httpx_client: postgrest and storage3 each overwrite its
+        # base_url and headers, so table queries would be sent to the storage API.
         options = ClientOptions(
-            postgrest_client_timeout=10
+            postgrest_client_timeout=_SUPABASE_CLIENT_TIMEOUT,
+            storage_client_timeout=_SUPABASE_CLIENT_TIMEOUT,
         )
 
         # Initialize Supabase client
@@ -36,6 +59,13 @@ def init_supabase(app):
             logger.error("Supabase client initialized but missing .auth. Check Supabase configuration.")
         else:
             logger.info("Supabase client initialized successfully.")
+            # supabase-py drops storage_client_timeout when a custom httpx client is in play,
+            # so check the timeout on the session storage3 actually sends requests through.
+            storage_timeout = getattr(getattr(supabase.storage, "session", None), "timeout", None)
+            if getattr(storage_timeout, "read", None) != _SUPABASE_CLIENT_TIMEOUT:
+                logger.warning(
+                    "Supabase storage client timeout is %s, expected %ss.", storage_timeout, _SUPABASE_CLIENT_TIMEOUT
+                )
 
     except Exception as e:
         logger.error(f"FATAL: Supabase initialization error: {e}", exc_info=True)
@@ -0,0 +1,72 @@
+import socket
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.util import Retry
+
+# Process-wide session for outbound calls to third-party APIs (TheirStack, Xano).
+# Keeps TCP/TLS connections alive between requests instead of reconnecting per call.
+# Retry's default allowed_methods excludes POST, so only connection failures are
+# retried for POSTs; a request that reached the upstream is never replayed.
+_retries = Retry(total=3, backoff_factor=0.2, status_forcelist=[502, 503, 504])
+
+# urllib3's defaults already disable Nagle (TCP_NODELAY); add TCP keepalives so
+# idle pooled connections to a dead peer are noticed.
+_SOCKET_OPTIONS = HTTPConnection.default_socket_options + [
+    (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+]
+
+
+class _TunedHTTPAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs.setdefault("socket_options", _SOCKET_OPTIONS)
+        super().init_poolmanager(*args, **kwargs)
+
+
+_adapter = _TunedHTTPAdapter(pool_connections=64, pool_maxsize=64, pool_block=False, max_retries=_retries)
+
+SESSION = requests.Session()
+SESSION.mount("http://", _adapter)
+SESSION.mount("https://", _adapter)
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker for outbound calls. Its lock only guards the
+    counters and is never held during the call itself, so concurrent requests still
+    run in parallel. After fail_max consecutive failures allow() returns False for
+    reset_timeout seconds; then one trial call is let through per reset_timeout until
+    a success closes the circuit again.
+    """
+
+    def __init__(self, fail_max, reset_timeout):
+        self._fail_max = fail_max
+        self._reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            now = time.monotonic()
+            if now - self._opened_at < self._reset_timeout:
+                return False
+            # Re-arm before letting this caller probe, so others keep failing fast meanwhile.
+            self._opened_at = now
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self._fail_max:
+                self._opened_at = time.monotonic()
@@ -1,5 +1,4 @@
-from flask import Blueprint, jsonify
-from app import extensions # To access extensions.supabase
+from flask import Blueprint, jsonify, current_app
 
 main_bp = Blueprint("main", __name__)
 
@@ -16,18 +15,19 @@ def test_supabase_connection():
     """
     A simple, unauthenticated endpoint to test the Supabase connection.
     """
-    if not extensions.supabase:
+    supabase = current_app.extensions.get("supabase")
+    if not supabase:
         return jsonify({"error": "Supabase client is not initialized."}), 500
 
     try:
         # Attempt to read from a public or known table like subscription_plans
         # We select 'id' because we know it exists, which confirms the connection.
-        response = extensions.supabase.table('subscription_plans').select('id').limit(1).execute()
+        response = supabase.table('subscription_plans').select('id').limit(1).execute()
         
         # The 'postgrest-py' library might return an object with a 'data' attribute
         # or it might be the data itself if using a different version or configuration.
         # We check for the data attribute first.
-        data_to_return = response.data if hasattr(response, 'data') else response
+        data_to_return = getattr(response, 'data', response)
 
         return jsonify({
             "message": "Successfully connected to Supabase and fetched data.",
@@ -0,0 +1,44 @@
+import itertools
+import threading
+from cachetools import TTLCache
+
+
+class ResponseCache:
+    """
+    Per-user TTL cache of serialized list responses that a read racing a write cannot
+    repopulate with stale data. A miss takes a token() before querying; evict() gives
+    the key a new generation, and put() only stores when the token is still current,
+    so a query that may predate the write is served once but not cached.
+
+    Entries live in this process only: with several gunicorn workers
+    (WEB_CONCURRENCY > 1) a write evicts just the handling worker's copy, and the
+    other workers keep serving theirs until the TTL expires.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self._entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        # Generations must outlive any in-flight query by far, so a key whose
+        # generation expired can't be mistaken for one that never changed.
+        self._generations = TTLCache(maxsize=maxsize * 4, ttl=max(ttl, 600))
+        self._counter = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            return self._entries.get(key)
+
+    def token(self, key):
+        """Snapshot of the key's generation; take it before running the query for a miss."""
+        with self._lock:
+            return self._generations.get(key)
+
+    def put(self, key, token, value):
+        """Caches value unless key was evicted since token() was taken."""
+        with self._lock:
+            if self._generations.get(key) == token:
+                self._entries[key] = value
+
+    def evict(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._generations[key] = next(self._counter)
@@ -1,13 +1,31 @@
 import boto3
+import functools
 import json
 from botocore.exceptions import ClientError
 
+# One boto3 session per process, created on first use; Secrets Manager clients are
+# reused per region so repeated lookups share botocore's connection pool.
+_session = None
+_client_cache = {}
+
+def _get_client(region_name):
+    global _session
+    client = _client_cache.get(region_name)
+    if client is None:
+        if _session is None:
+            _session = boto3.session.Session()
+        client = _client_cache.setdefault(
+            region_name,
+            _session.client(
+                service_name='secretsmanager',
+                region_name=region_name,
+            ),
+        )
+    return client
+
+@functools.lru_cache(maxsize=32)
 def get_secret(secret_name, region_name="us-east-1"):
-    session = boto3.session.Session()
-    client = session.client(
-        service_name='secretsmanager',
-        region_name=region_name,
-    )
+    client = _get_client(region_name)
 
     try:
         get_secret_value_response = client.get_secret_value(
@@ -23,4 +41,48 @@ def get_secret(secret_name, region_name="us-east-1"):
             return json.loads(secret)
         else:
             # If your secret is binary, handle it here
-            return get_secret_value_response['SecretBinary']
\ No newline at end of file
+            return get_secret_value_response['SecretBinary']
+
+def get_secrets(secret_names, region_name="us-east-1"):
+    """
+    Fetches several JSON secrets and merges them into one dict (later names win on
+    key collisions). Multiple names are fetched with BatchGetSecretValue, one round
+    trip per 20 secrets instead of one per secret; a single name uses get_secret.
+    """
+    secret_names = tuple(secret_names)
+    if len(secret_names) == 1:
+        return get_secret(secret_names[0], region_name)
+    return _get_secrets_batch(secret_names, region_name)
+
+@functools.lru_cache(maxsize=32)
+def _get_secrets_batch(secret_names, region_name):
+    client = _get_client(region_name)
+    values_by_name = {}
+    errors = []
+
+    try:
+        request_args = {'SecretIdList': list(secret_names)}
+        while True:
+            page = client.batch_get_secret_value(**request_args)
+            for secret_value in page.get('SecretValues', []):
+                value = json.loads(secret_value['SecretString'])
+                # Callers may pass either the friendly name or the ARN.
+                values_by_name[secret_value['Name']] = value
+                values_by_name[secret_value['ARN']] = value
+            errors.extend(page.get('Errors', []))
+            if not page.get('NextToken'):
+                break
+            request_args['NextToken'] = page['NextToken']
+    except ClientError as e:
+        print(f"Error fetching secrets: {e}")
+        raise e
+
+    for error in errors:
+        print(f"Error fetching secret {error.get('SecretId')}: {error.get('ErrorCode')} - {error.get('Message')}")
+    if errors:
+        raise RuntimeError(f"Could not fetch {len(errors)} of {len(secret_names)} secrets.")
+
+    merged = {}
+    for name in secret_names:
+        merged.update(values_by_name.get(name, {}))
+    return merged
@@ -0,0 +1,53 @@
+import io
+
+# libmagic identifies PDFs, Office documents and images from their first bytes.
+_SNIFF_BYTES = 2048
+
+# Werkzeug spools multipart uploads to a temporary file, but storage3 only sends
+# BufferedReader/FileIO objects as-is and would treat any other stream as a path.
+# That check is storage3-internal, which is why storage3 is pinned in requirements.txt.
+# Wrapping the spooled stream lets httpx read it in chunks instead of the route
+# first copying the whole upload into memory with file.read().
+
+
+class _StreamRaw(io.RawIOBase):
+    def __init__(self, stream):
+        self._stream = stream
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._stream.read(len(buffer))
+        n = len(data)
+        buffer[:n] = data
+        return n
+
+    # seek/tell let httpx size the multipart body up front and send a Content-Length.
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self._stream.seek(offset, whence)
+
+    def tell(self):
+        return self._stream.tell()
+
+
+def upload_body(file_storage):
+    """
+    Returns a reader over an uploaded werkzeug FileStorage, rewound to the start,
+    that can be passed straight to supabase.storage.from_(...).upload().
+    storage3 closes the reader once the upload finishes.
+    """
+    file_storage.stream.seek(0)
+    return io.BufferedReader(_StreamRaw(file_storage.stream))
+
+
+def sniff_head(file_storage):
+    """Returns the first bytes of an upload for python-magic, leaving the stream rewound."""
+    stream = file_storage.stream
+    stream.seek(0)
+    head = stream.read(_SNIFF_BYTES)
+    stream.seek(0)
+    return head
@@ -1,72 +1,121 @@
-from flask import request, jsonify, current_app
+from flask import Response, request, jsonify, current_app, stream_with_context
+import orjson
 import requests
 
+from app.http_client import SESSION, CircuitBreaker
 from app.userPortal.subscription.helpers import require_authentication, check_and_use_feature
 
 from . import job_listing_bp
 
 
-# @job_listing_bp.after_request
-# def _add_cors_headers(resp):
-#     """
-#     Ensure all job-listing responses (including OPTIONS pre-flight) have
-#     the required CORS headers so the browser lets the request through.
-#     """
-#     origin = request.headers.get("Origin")
-#     if origin:
-#         resp.headers["Access-Control-Allow-Origin"] = origin
-#     resp.headers["Access-Control-Allow-Methods"] = "GET,POST,OPTIONS"
-#     resp.headers["Access-Control-Allow-Headers"] = "Content-Type,Authorization"
-#     resp.headers["Access-Control-Allow-Credentials"] = "true"
-#     return resp
-# ---------------------------------------------------------------------------
+# TheirStack settings are static for the lifetime of the app, so they are
+# resolved once when the blueprint is registered rather than on every request.
+_THEIRSTACK = {"url": None, "headers": None, "timeout": (3.05, 30)}
 
-@job_listing_bp.route("/search-jobs", methods=["POST", "OPTIONS"])
-@require_authentication
-def search_jobs():
-    """Proxy endpoint to search job listings via TheirStack API.
+# After 5 consecutive network failures or 5xx responses, fail fast for 30s
+# instead of holding a worker thread for every request against a struggling upstream.
+# Client errors (4xx) are the caller's problem and do not count.
+_THEIRSTACK_BREAKER = CircuitBreaker(fail_max=5, reset_timeout=30)
 
-    The client sends a JSON payload that largely mirrors the TheirStack API
-    parameters. We forward that payload to the upstream service and return
-    the response. A valid JWT must be supplied in the Authorization header
-    (handled by ``@require_authentication``).
-    """
-    # Handle CORS pre-flight quickly (already taken care of in require_authentication)
 
-    # Retrieve configuration
-    api_key = current_app.config.get("THEIRSTACK_API_KEY")
-    theirstack_url = current_app.config.get(
+@job_listing_bp.record_once
+def _load_theirstack_config(state):
+    config = state.app.config
+    api_key = config.get("THEIRSTACK_API_KEY")
+    _THEIRSTACK["url"] = config.get(
         "THEIRSTACK_API_URL_JOBS_SEARCH", "https://api.theirstack.com/v1/jobs/search"
     )
+    # (connect, read): an unreachable host fails in seconds, not after the full read budget.
+    _THEIRSTACK["timeout"] = (3.05, config.get("THEIRSTACK_HTTP_TIMEOUT", 30))  # seconds
+    # Kept per-request rather than on the shared SESSION, which also talks to Xano.
+    _THEIRSTACK["headers"] = {
+        "Accept": "application/json",
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {api_key}",
+    } if api_key else None
+
+
+def _iter_upstream(response, chunk_size=8192):
+    """Yield the upstream body in chunks and release the connection afterwards."""
+    try:
+        yield from response.iter_content(chunk_size)
+    finally:
+        response.close()
 
-    if not api_key:
+
+def _client_body():
+    """Returns the request's JSON body as bytes, ready to forward unchanged.
+
+    Mirrors the old ``request.get_json(silent=True) or {}``: a non-JSON request
+    or a missing, invalid or empty JSON body becomes ``{}``.
+    """
+    if not request.is_json:
+        return b"{}"
+    raw = request.get_data(cache=False)
+    try:
+        if raw and orjson.loads(raw):
+            return raw
+    except orjson.JSONDecodeError:
+        pass
+    return b"{}"
+
+
+def _post_theirstack(body):
+    """POSTs ``body`` to TheirStack and records the outcome on the circuit breaker."""
+    try:
+        response = SESSION.post(
+            _THEIRSTACK["url"],
+            headers=_THEIRSTACK["headers"],
+            data=body,
+            timeout=_THEIRSTACK["timeout"],
+            stream=True,
+        )
+        response.raise_for_status()
+    except requests.exceptions.HTTPError as http_err:
+        if http_err.response.status_code >= 500:
+            _THEIRSTACK_BREAKER.record_failure()
+        else:
+            _THEIRSTACK_BREAKER.record_success()
+        raise
+    except requests.exceptions.RequestException:
+        _THEIRSTACK_BREAKER.record_failure()
+        raise
+    _THEIRSTACK_BREAKER.record_success()
+    return response
+
+
+def _proxy_theirstack(body):
+    """Forward the JSON ``body`` (bytes) to the TheirStack jobs search API.
+
+    Returns a ``(response, status_code)`` tuple. Successful upstream bodies
+    are streamed back unchanged; failures are wrapped in a JSON error.
+    """
+    if _THEIRSTACK["headers"] is None:
         current_app.logger.error("Missing THEIRSTACK_API_KEY in application configuration.")
         return (
             jsonify({"error": "Server misconfiguration: missing external API key."}),
             500,
         )
 
-    request_timeout = current_app.config.get("THEIRSTACK_HTTP_TIMEOUT", 30)  # seconds
+    if not _THEIRSTACK_BREAKER.allow():
+        current_app.logger.warning("TheirStack circuit breaker is open; failing fast.")
+        return (
+            jsonify({"error": "Job search is temporarily unavailable. Please try again shortly."}),
+            503,
+        )
 
     try:
-        # Use the JSON body as-is; default to an empty dict if none supplied
-        client_payload = request.get_json(silent=True) or {}
-
-        headers = {
-            "Accept": "application/json",
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {api_key}",
-        }
-
-        response = requests.post(
-            theirstack_url,
-            headers=headers,
-            json=client_payload,
-            timeout=request_timeout,
-        )
-        response.raise_for_status()
+        response = _post_theirstack(body)
 
-        return jsonify(response.json()), response.status_code
+        # The body is passed through untouched, so stream it instead of
+        # decoding and re-encoding the whole (often large) JSON document.
+        return (
+            Response(
+                stream_with_context(_iter_upstream(response)),
+                content_type=response.headers.get("Content-Type", "application/json"),
+            ),
+            response.status_code,
+        )
 
     except requests.exceptions.HTTPError as http_err:
         # Attempt to provide the upstream error payload when available
@@ -89,16 +138,16 @@ def search_jobs():
             500,
         )
     except Exception as e:
-        current_app.logger.error("Unexpected error in search_jobs: %s", str(e), exc_info=True)
+        current_app.logger.error("Unexpected error in TheirStack proxy: %s", str(e), exc_info=True)
         return (
             jsonify({"error": "An unexpected error occurred", "details": str(e)}),
             500,
-        ) 
+        )
 
-@job_listing_bp.route("/get-job-details", methods=["POST", "OPTIONS"])
+
+@job_listing_bp.route("/search-jobs", methods=["POST", "OPTIONS"])
 @require_authentication
-@check_and_use_feature("job_search_results")
-def get_job_details():
+def search_jobs():
     """Proxy endpoint to search job listings via TheirStack API.
 
     The client sends a JSON payload that largely mirrors the TheirStack API
@@ -106,66 +155,17 @@ def get_job_details():
     the response. A valid JWT must be supplied in the Authorization header
     (handled by ``@require_authentication``).
     """
-    # Handle CORS pre-flight quickly (already taken care of in require_authentication)
-
-    # Retrieve configuration
-    api_key = current_app.config.get("THEIRSTACK_API_KEY")
-    theirstack_url = current_app.config.get(
-        "THEIRSTACK_API_URL_JOBS_SEARCH", "https://api.theirstack.com/v1/jobs/search"
-    )
-
-    if not api_key:
-        current_app.logger.error("Missing THEIRSTACK_API_KEY in application configuration.")
-        return (
-            jsonify({"error": "Server misconfiguration: missing external API key."}),
-            500,
-        )
-
-    request_timeout = current_app.config.get("THEIRSTACK_HTTP_TIMEOUT", 30)  # seconds
-
-    try:
-        # Use the JSON body as-is; default to an empty dict if none supplied
-        client_payload = request.get_json(silent=True) or {}
-
-        headers = {
-            "Accept": "application/json",
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {api_key}",
-        }
-
-        response = requests.post(
-            theirstack_url,
-            headers=headers,
-            json=client_payload,
-            timeout=request_timeout,
-        )
-        response.raise_for_status()
+    # Use the JSON body as-is; default to an empty dict if none supplied
+    return _proxy_theirstack(_client_body())
 
-        return jsonify(response.json()), response.status_code
 
-    except requests.exceptions.HTTPError as http_err:
-        # Attempt to provide the upstream error payload when available
-        try:
-            error_detail = http_err.response.json()
-        except ValueError:
-            error_detail = http_err.response.text
+@job_listing_bp.route("/get-job-details", methods=["POST", "OPTIONS"])
+@require_authentication
+@check_and_use_feature("job_search_results")
+def get_job_details():
+    """Proxy endpoint to fetch job details via TheirStack API.
 
-        current_app.logger.warning(
-            "TheirStack API request failed with status %s: %s", http_err.response.status_code, error_detail
-        )
-        return (
-            jsonify({"error": "TheirStack API request failed", "details": error_detail}),
-            http_err.response.status_code,
-        )
-    except requests.exceptions.RequestException as req_err:
-        current_app.logger.error("Network error during TheirStack API request: %s", str(req_err))
-        return (
-            jsonify({"error": "Request to TheirStack API failed", "details": str(req_err)}),
-            500,
-        )
-    except Exception as e:
-        current_app.logger.error("Unexpected error in search_jobs: %s", str(e), exc_info=True)
-        return (
-            jsonify({"error": "An unexpected error occurred", "details": str(e)}),
-            500,
-        ) 
\ No newline at end of file
+    Same upstream call as ``search_jobs``, but each successful request counts
+    against the user's ``job_search_results`` feature quota.
+    """
+    return _proxy_theirstack(_client_body())
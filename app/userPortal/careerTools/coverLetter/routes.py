@@ -1,29 +1,78 @@
 from flask import request, jsonify, current_app, g
 import requests 
-from app import extensions 
-import json
+import orjson
+from app.background import BatchInserter
+from app.http_client import SESSION
 from app.userPortal.subscription.helpers import require_authentication, check_and_use_feature
 
 
 from . import cover_letter_bp 
 
+# Error responses only echo a bounded slice of Xano's output; cover-letter
+# feedback can be tens of KB.
+_RAW_FEEDBACK_PREVIEW_CHARS = 512
+_XANO_PREVIEW_KEYS = ("status", "id")
+
+# (connect, read) seconds: fail fast if Xano is unreachable, but allow for slow generation.
+_XANO_TIMEOUT = (5, 120)
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+
+def _client_error_detail(parsed_feedback):
+    """Replaces the full raw feedback (still stored in the DB) with a short preview."""
+    if "raw_feedback" not in parsed_feedback:
+        return parsed_feedback
+    detail = {k: v for k, v in parsed_feedback.items() if k != "raw_feedback"}
+    raw = parsed_feedback["raw_feedback"]
+    if not isinstance(raw, str):
+        raw = str(raw)
+    detail["raw_feedback_preview"] = raw[:_RAW_FEEDBACK_PREVIEW_CHARS]
+    detail["raw_feedback_len"] = len(raw)
+    return detail
+
+
+# The list view skips the large feedback/resume/comments columns.
+_LIST_COLUMNS = "id,job_description,company_website,created_at"
+_DEFAULT_PAGE_SIZE = 20
+_MAX_PAGE_SIZE = 100
+
+# Resolved once when the blueprint is registered; config does not change at runtime.
+_XANO = {"cover_letter_url": None}
+
+
+@cover_letter_bp.record_once
+def _load_xano_config(state):
+    _XANO["cover_letter_url"] = state.app.config.get("XANO_API_URL_COVER_LETTER")
+    if not _XANO["cover_letter_url"]:
+        state.app.logger.error("Missing XANO_API_URL_COVER_LETTER in application configuration.")
+
+
+# Generated cover letters are persisted off the request path, coalescing
+# concurrent requests into multi-row inserts.
+_cover_letter_writer = BatchInserter("cover_letter")
+
+
 @cover_letter_bp.route("/create-cover-letter", methods=["POST", "OPTIONS"])
 @require_authentication
 @check_and_use_feature('cover_letter')
 def create_cover_letter():
-    current_user_id = str(g.user.id)
+    current_user_id = g.user.id
 
-    frontend_url = current_app.config.get("FRONTEND_ORIGIN", "http://localhost:3000")
-    xano_api_url_cover_letter = current_app.config.get("XANO_API_URL_COVER_LETTER")
+    xano_api_url_cover_letter = _XANO["cover_letter_url"]
+    if not xano_api_url_cover_letter:
+        return jsonify({"error": "Server misconfiguration: cover letter service URL is not set."}), 500
 
     try:
-        data = request.form
+        # JSON clients skip the multipart/urlencoded form parser entirely.
+        data = request.get_json(silent=True) if request.is_json else None
+        if not isinstance(data, dict):
+            data = request.form
         current_resume_url = data.get("current_resume")
         job_description_text = data.get("job_description")
         company_website_text = data.get("company_website")
         user_additional_comments_text = data.get("additional_comments")
 
-        if not all([current_resume_url, job_description_text]):
+        if not current_resume_url or not job_description_text:
             return jsonify({"error": "Missing required fields: current_resume (URL) and job_description"}), 400
 
         xano_payload = {
@@ -33,25 +82,30 @@ def create_cover_letter():
             "additional_comments": user_additional_comments_text
         }
 
-        xano_response = requests.post(xano_api_url_cover_letter, json=xano_payload)
+        xano_response = SESSION.post(
+            xano_api_url_cover_letter,
+            data=orjson.dumps(xano_payload),
+            headers=_JSON_HEADERS,
+            timeout=_XANO_TIMEOUT,
+        )
         xano_response.raise_for_status()
-        xano_data = xano_response.json()
+        xano_data = orjson.loads(xano_response.content)
 
         parsed_feedback_from_xano = None
         raw_feedback_payload_str = xano_data.get("feedback")
 
         if isinstance(raw_feedback_payload_str, str):
             try:
-                parsed_feedback_from_xano = json.loads(raw_feedback_payload_str)
-            except json.JSONDecodeError as e:
-                print(f"Cover Letter: Error decoding JSON string from Xano 'feedback' key: {e}. Storing raw string or null.")
+                parsed_feedback_from_xano = orjson.loads(raw_feedback_payload_str)
+            except orjson.JSONDecodeError as e:
+                current_app.logger.warning("Cover Letter: Error decoding JSON string from Xano 'feedback' key: %s. Storing raw string.", e)
                 parsed_feedback_from_xano = {"error": "Failed to parse feedback string", "raw_feedback": raw_feedback_payload_str}
 
         elif raw_feedback_payload_str is not None: # It exists but is not a string
-             print(f"Cover Letter: Xano 'feedback' key present but not a string. Type: {type(raw_feedback_payload_str)}")
+             current_app.logger.warning("Cover Letter: Xano 'feedback' key present but not a string. Type: %s", type(raw_feedback_payload_str).__name__)
              parsed_feedback_from_xano = {"error": "Feedback key not a string", "raw_feedback": raw_feedback_payload_str}
         else: # feedback key is missing
-            print(f"Cover Letter: Xano 'feedback' key missing in response.")
+            current_app.logger.warning("Cover Letter: Xano 'feedback' key missing in response.")
             parsed_feedback_from_xano = {"error": "Feedback key missing in Xano response"}
 
 
@@ -65,56 +119,84 @@ def create_cover_letter():
             "feedback": parsed_feedback_from_xano 
         }
 
-        try:
-            insert_response = extensions.supabase.table("cover_letter").insert(db_payload).execute()
-            if not insert_response.data:
-                print(f"Warning: Supabase insert into cover_letter may have failed or returned no data. Response: {insert_response}")
-        except Exception as e:
-            print(f"Error inserting into cover_letter table: {str(e)}")
+        # The client only needs Xano's feedback, so persist it off the request path.
+        _cover_letter_writer.put(db_payload)
 
 
         if parsed_feedback_from_xano and "error" not in parsed_feedback_from_xano:
-            return jsonify(parsed_feedback_from_xano), 200
+            # Xano's feedback string is already valid JSON (it just parsed), so send it
+            # as-is rather than re-encoding the parsed copy.
+            return current_app.response_class(raw_feedback_payload_str, mimetype="application/json"), 200
         else: 
-            error_detail_for_client = parsed_feedback_from_xano if parsed_feedback_from_xano else {"error": "Processing Xano response failed"}
+            error_detail_for_client = _client_error_detail(parsed_feedback_from_xano) if parsed_feedback_from_xano else {"error": "Processing Xano response failed"}
             return jsonify({"message": "Xano request processed, but there was an issue with feedback content.", 
                             "xano_response_status": xano_response.status_code,
                             "details": error_detail_for_client,
-                            "full_xano_response_preview": xano_data if 'feedback' not in xano_data else {k:v for k,v in xano_data.items() if k != 'feedback'}
+                            "full_xano_response_preview": {k: xano_data[k] for k in _XANO_PREVIEW_KEYS if k in xano_data}
                            }), 207
 
 
     except requests.exceptions.HTTPError as http_err:
         try:
-            error_detail = http_err.response.json()
+            error_detail = orjson.loads(http_err.response.content)
         except ValueError:
             error_detail = str(http_err.response.text) 
         return jsonify({"error": "Xano API request failed", "details": error_detail}), http_err.response.status_code
+    except requests.exceptions.Timeout:
+        current_app.logger.warning("Request to Xano cover-letter API timed out.")
+        return jsonify({"error": "The cover letter service timed out. Please try again."}), 504
     except requests.exceptions.RequestException as req_err:
         return jsonify({"error": "Request to Xano API failed", "details": str(req_err)}), 500
     except Exception as e:
-        print(f"Unexpected error in create_cover_letter: {str(e)}")
+        current_app.logger.error("Unexpected error in create_cover_letter: %s", e, exc_info=True)
         return jsonify({"error": "An unexpected error occurred", "details": str(e)}), 500
 
 
 @cover_letter_bp.route("/get-cover-letters", methods=["GET", "OPTIONS"])
 @require_authentication
 def get_cover_letters():
-    current_user_id = str(g.user.id)
+    """
+    Lists the user's cover letters, newest first, one page at a time
+    (?page=1&page_size=20, page_size capped at 100). Only summary columns are
+    returned; fetch the full row, including feedback, from /get-cover-letter/<id>.
+    """
+    supabase = current_app.extensions["supabase"]
+    current_user_id = g.user.id
+    page = max(request.args.get("page", 1, type=int) or 1, 1)
+    page_size = min(max(request.args.get("page_size", _DEFAULT_PAGE_SIZE, type=int) or _DEFAULT_PAGE_SIZE, 1), _MAX_PAGE_SIZE)
+    offset = (page - 1) * page_size
     try:
         query_response = (
-            extensions.supabase.table("cover_letter")
-            .select("*")  
+            supabase.table("cover_letter")
+            .select(_LIST_COLUMNS)
             .eq("uid", current_user_id)
+            .order("created_at", desc=True)
+            .range(offset, offset + page_size - 1)
             .execute()
         )
         return jsonify(query_response.data or []), 200
     except Exception as e:
-        print(f"Error fetching from cover_letter table: {str(e)}")
+        current_app.logger.error("Error fetching from cover_letter table: %s", e)
         return jsonify({"error": f"Could not retrieve cover letters: {str(e)}"}), 500
 
 
-
-
-
-
+@cover_letter_bp.route("/get-cover-letter/<int:cover_letter_id>", methods=["GET", "OPTIONS"])
+@require_authentication
+def get_cover_letter(cover_letter_id):
+    supabase = current_app.extensions["supabase"]
+    current_user_id = g.user.id
+    try:
+        query_response = (
+            supabase.table("cover_letter")
+            .select("*")
+            .eq("id", cover_letter_id)
+            .eq("uid", current_user_id)
+            .limit(1)
+            .execute()
+        )
+        if not query_response.data:
+            return jsonify({"error": "Cover letter not found"}), 404
+        return jsonify(query_response.data[0]), 200
+    except Exception as e:
+        current_app.logger.error("Error fetching cover letter %s: %s", cover_letter_id, e)
+        return jsonify({"error": f"Could not retrieve cover letter: {str(e)}"}), 500
@@ -1,38 +1,121 @@
 from flask import request, jsonify, current_app, g
 import requests 
-from app import extensions 
-import json
-import logging 
+import hashlib
+import re
+import orjson
 from gotrue.errors import AuthApiError
+from app.background import run_in_background
+from app.http_client import SESSION
+from app.response_cache import ResponseCache
 from app.userPortal.subscription.helpers import require_authentication, check_and_use_feature
 
 
 from . import linkedin_optimizer_bp
 
+# Serialized history per user with its ETag. Dashboards poll this endpoint, so a
+# short TTL absorbs repeat reads; a new optimization evicts the user's entry in
+# this worker (see ResponseCache for the generation guard and per-process scope).
+_HISTORY_CACHE = ResponseCache(maxsize=5000, ttl=15)
+# The list view ships only the explanation out of the large api_response jsonb;
+# the full row is served by /linkedin-optimizer/history/<id>.
+_HISTORY_COLUMNS = "id,linkedin_url,comments,created_at,explanation:api_response->explanation"
+_HISTORY_LIMIT = 50
+
+# Cheap input checks before the expensive Xano call: a profile URL (scheme,
+# www/mobile/country subdomain, trailing slash and query string optional) and bounded comments.
+_LINKEDIN_PROFILE_RE = re.compile(
+    r"^(?:https?://)?(?:[a-z]{1,3}\.)?linkedin\.com/(?:in|pub)/[A-Za-z0-9\-_%]{1,100}/?(?:\?\S*)?$",
+    re.IGNORECASE,
+)
+_MAX_COMMENTS_CHARS = 4000
+
+# Resolved once when the blueprint is registered; config does not change at runtime.
+_XANO = {"linkedin_optimizer_url": None}
+
+
+@linkedin_optimizer_bp.record_once
+def _load_xano_config(state):
+    _XANO["linkedin_optimizer_url"] = state.app.config.get("XANO_API_URL_LINKEDIN_OPTIMIZER")
+    if not _XANO["linkedin_optimizer_url"]:
+        state.app.logger.error("Missing XANO_API_URL_LINKEDIN_OPTIMIZER in application configuration.")
+
+# (connect, read) seconds: fail fast if Xano is unreachable, but allow for slow generation.
+_XANO_TIMEOUT = (5, 120)
+
+def _persist_optimization(insert_data):
+    supabase = current_app.extensions["supabase"]
+    # Nothing reads the inserted row back, so don't have PostgREST return it
+    # (api_response is a large jsonb column). A failed insert raises APIError,
+    # which run_in_background logs.
+    supabase.table("linkedIn_optimizer").insert(insert_data, returning="minimal").execute()
+
+    # Evict only once the row exists; the new generation also stops a history read
+    # that queried before the insert committed from caching its stale list.
+    _HISTORY_CACHE.evict(insert_data["uid"])
+
+
 @linkedin_optimizer_bp.route("/linkedin-optimizer/history", methods=["GET", "OPTIONS"])
 @require_authentication
 def get_linkedin_optimizer_history():
-    current_user_id = str(g.user.id)
+    supabase = current_app.extensions["supabase"]
+    current_user_id = g.user.id
+
+    cached = _HISTORY_CACHE.get(current_user_id)
+    if cached is None:
+        generation = _HISTORY_CACHE.token(current_user_id)
+        try:
+            query_response = (
+                supabase.table("linkedIn_optimizer")
+                .select(_HISTORY_COLUMNS)
+                .eq("uid", current_user_id)
+                .order('created_at', desc=True)
+                .limit(_HISTORY_LIMIT)
+                .execute()
+            )
+        except Exception as e:
+            current_app.logger.error("Error fetching from linkedin_optimizer table: %s", e)
+            return jsonify({"error": f"Could not retrieve linkedin optimizer history: {str(e)}"}), 500
+        body = orjson.dumps(query_response.data or [])
+        cached = (body, hashlib.blake2b(body, digest_size=16).hexdigest())
+        _HISTORY_CACHE.put(current_user_id, generation, cached)
+
+    body, etag = cached
+    response = current_app.response_class(body, mimetype="application/json")
+    response.set_etag(etag)
+    # Answers 304 with no body when the client's If-None-Match still matches.
+    return response.make_conditional(request)
+
+
+@linkedin_optimizer_bp.route("/linkedin-optimizer/history/<int:optimization_id>", methods=["GET", "OPTIONS"])
+@require_authentication
+def get_linkedin_optimization(optimization_id):
+    supabase = current_app.extensions["supabase"]
+    current_user_id = g.user.id
 
     try:
         query_response = (
-            extensions.supabase.table("linkedIn_optimizer")
+            supabase.table("linkedIn_optimizer")
             .select("*")
+            .eq("id", optimization_id)
             .eq("uid", current_user_id)
-            .order('created_at', desc=True)
+            .limit(1)
             .execute()
         )
-        return jsonify(query_response.data or []), 200
+        if not query_response.data:
+            return jsonify({"error": "LinkedIn optimization not found"}), 404
+        return jsonify(query_response.data[0]), 200
     except Exception as e:
-        print(f"Error fetching from linkedin_optimizer table: {str(e)}")
-        return jsonify({"error": f"Could not retrieve linkedin optimizer history: {str(e)}"}), 500
+        current_app.logger.error("Error fetching linkedin optimization %s: %s", optimization_id, e)
+        return jsonify({"error": f"Could not retrieve linkedin optimization: {str(e)}"}), 500
 
 @linkedin_optimizer_bp.route("/linkedin-optimizer", methods=["POST","OPTIONS"])
 @require_authentication
 @check_and_use_feature('linkedin_optimize')
 def create_linkedin_optimization():
-    current_user_id = str(g.user.id)
-    XANO_API_URL_LINKEDIN_OPTIMIZER = current_app.config.get("XANO_API_URL_LINKEDIN_OPTIMIZER")
+    current_user_id = g.user.id
+    XANO_API_URL_LINKEDIN_OPTIMIZER = _XANO["linkedin_optimizer_url"]
+    if not XANO_API_URL_LINKEDIN_OPTIMIZER:
+        return jsonify({"error": "Server misconfiguration: optimization service URL is not set."}), 500
     
     data = request.get_json()
     if not data:
@@ -43,29 +126,37 @@ def create_linkedin_optimization():
 
     if not linkedin_url:
         return jsonify({"error": "linkedin_url is required"}), 400
+    if not isinstance(linkedin_url, str):
+        return jsonify({"error": "linkedin_url must be a LinkedIn profile URL (linkedin.com/in/...)"}), 400
+    # Validate, send and store the same normalized value.
+    linkedin_url = linkedin_url.strip()
+    if not _LINKEDIN_PROFILE_RE.match(linkedin_url):
+        return jsonify({"error": "linkedin_url must be a LinkedIn profile URL (linkedin.com/in/...)"}), 400
     if not comments:
         return jsonify({"error": "comments are required"}), 400
+    if not isinstance(comments, str) or len(comments) > _MAX_COMMENTS_CHARS:
+        return jsonify({"error": f"comments must be text of at most {_MAX_COMMENTS_CHARS} characters"}), 400
 
     try:
         xano_payload = {"linkedin_url": linkedin_url, "comments": comments}
-        logging.info(f"Sending payload to Xano: {json.dumps(xano_payload)}") 
+        current_app.logger.debug("Sending payload to Xano: %s", xano_payload)
 
-        xano_response = requests.post(XANO_API_URL_LINKEDIN_OPTIMIZER, json=xano_payload) 
+        xano_response = SESSION.post(XANO_API_URL_LINKEDIN_OPTIMIZER, json=xano_payload, timeout=_XANO_TIMEOUT)
         xano_response.raise_for_status() 
         
         # The new Xano response is a clean JSON object with 'changes' and 'explanation' keys.
         # This simplifies the parsing logic significantly compared to the old implementation.
         try:
-            api_data = xano_response.json()
+            api_data = orjson.loads(xano_response.content)
             if not isinstance(api_data, dict):
-                logging.error(f"Xano response was not a JSON object. Raw: {xano_response.text}")
+                current_app.logger.error("Xano response was not a JSON object. Raw: %s", xano_response.content[:500].decode("utf-8", "replace"))
                 return jsonify({"error": "Invalid data format from optimization service."}), 500
-        except json.JSONDecodeError:
-            logging.error(f"Failed to parse Xano response as JSON. Raw: {xano_response.text}")
+        except orjson.JSONDecodeError:
+            current_app.logger.error("Failed to parse Xano response as JSON. Raw: %s", xano_response.content[:500].decode("utf-8", "replace"))
             return jsonify({"error": "Failed to parse response from optimization service."}), 500
         
         if not api_data: 
-             logging.warning(f"Xano API returned empty or null data after parsing.")
+             current_app.logger.warning("Xano API returned empty or null data after parsing.")
              return jsonify({"error": "Invalid response from optimization service: received empty data."}), 500
 
         user_display_name = (g.user.user_metadata.get('full_name') or
@@ -80,18 +171,11 @@ def create_linkedin_optimization():
             "api_response": api_data 
         }
         
-        result = extensions.supabase.table("linkedIn_optimizer").insert(insert_data).execute()
-
-        if not result.data and not (hasattr(result, 'status_code') and 200 <= result.status_code < 300) : # Check for successful insert, some clients might not return data on success
-             print(f"Supabase insert failed or returned no data. Result: {result}")
-             error_detail = "Unknown error during Supabase insert."
-             if hasattr(result, 'error') and result.error:
-                 error_detail = str(result.error.message if hasattr(result.error, 'message') else result.error)
-             elif hasattr(result, 'message') and result.message:
-                 error_detail = result.message
-             return jsonify({"error": f"Failed to save linkedin optimization data: {error_detail}"}), 500
+        # The client only needs Xano's result, so persist it off the request path.
+        run_in_background(_persist_optimization, insert_data)
 
-        return jsonify(api_data), 200 # Return Xano's response
+        # Return Xano's response; its bytes were just validated as a JSON object, so skip re-encoding.
+        return current_app.response_class(xano_response.content, mimetype="application/json"), 200
 
     except requests.exceptions.HTTPError as http_err:
         error_message = f"Error from optimization service (HTTP {http_err.response.status_code})"
@@ -100,21 +184,18 @@ def create_linkedin_optimization():
             error_message += f" - Details: {xano_error_details}"
         except ValueError: # If Xano error response is not JSON
             error_message += f" - Response body: {http_err.response.text}"
-        print(error_message)
+        current_app.logger.warning("%s", error_message)
         # Use Xano's status code if available, otherwise 502
         return jsonify({"error": error_message}), getattr(http_err.response, 'status_code', 502)
     except requests.exceptions.Timeout:
-        print("Request to Xano API timed out.")
+        current_app.logger.warning("Request to Xano API timed out.")
         return jsonify({"error": "The optimization service timed out. Please try again."}), 504
     except requests.exceptions.RequestException as e: # For network errors, DNS failures, etc.
-        print(f"Error calling Xano API: {str(e)}")
+        current_app.logger.error("Error calling Xano API: %s", e)
         return jsonify({"error": f"Could not connect to optimization service: {str(e)}"}), 503
-    except json.JSONDecodeError as e: # Catch issues from json.loads(xano_response_text) specifically
-        print(f"Error parsing Xano API response string: {str(e)}. Response text was: {xano_response.text if 'xano_response' in locals() else 'not captured'}")
-        return jsonify({"error": "Invalid response format from optimization service."}), 500
     except Exception as e: # Catch-all for other unexpected errors
         error_str = str(e)
-        print(f"Error processing linkedin optimization POST request: {error_str}")
+        current_app.logger.exception("Error processing linkedin optimization POST request: %s", error_str)
         return jsonify({"error": f"An unexpected error occurred: {error_str}"}), 500
 
 # Remove the old combined route if it exists or comment it out.
@@ -1,17 +1,88 @@
 from flask import request, jsonify, current_app, g
 import requests 
-from app import extensions 
 import magic
 import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+import orjson
+from app.background import BatchInserter
+from app.http_client import SESSION
+from app.response_cache import ResponseCache
+from app.uploads import sniff_head, upload_body
+from app.userPortal.documents.routes import evict_user_documents
 from app.userPortal.subscription.helpers import require_authentication, check_and_use_feature
 
 from . import resume_analyze_bp 
 
+# (connect, read): fail fast on an unreachable Xano, keep the long read budget for the analysis itself.
+_XANO_TIMEOUT = (3, 180)
+
+# Serialized /get-analyze-resume body per user with its ETag. A short TTL absorbs
+# repeat reads; rows written by analyze/roast evict their user's entry when queued
+# and again once stored (see ResponseCache for the generation guard and per-process scope).
+_ANALYSES_CACHE = ResponseCache(maxsize=5000, ttl=30)
+# The list view leaves out the large feedback_analysis jsonb; the full row is
+# served by /analyze-resume/<id>.
+_ANALYSES_COLUMNS = "id,current_resume,resume_id,company_website,job_description,additional_comment,created_at"
+_ANALYSES_LIMIT = 50
+
+
+def _evict_analyses(rows):
+    for row in rows:
+        _ANALYSES_CACHE.evict(row["user_id"])
+
+
+# Analyze and roast results are persisted off the request path, coalescing
+# concurrent requests into multi-row inserts.
+_analyze_resume_writer = BatchInserter("analyze_resume", on_insert=_evict_analyses)
+
+
+def _lookup_resume_id(document_url, user_id):
+    """Returns the user_documents id for the user's document at document_url, or None."""
+    supabase = current_app.extensions["supabase"]
+    try:
+        doc_query = supabase.table("user_documents") \
+            .select("id") \
+            .eq("document_url", document_url) \
+            .eq("uid", user_id) \
+            .limit(1) \
+            .execute()
+    except Exception as e:
+        current_app.logger.error("Error querying for resume_id: %s", e)
+        return None
+    if doc_query.data and doc_query.data[0].get("id"):
+        return doc_query.data[0].get("id")
+    current_app.logger.warning("Could not find resume_id for URL: %s and user: %s", document_url, user_id)
+    return None
+
+
+# Dedicated to lookups a request thread waits on, so they never queue behind the
+# best-effort work in app.background. Sized to gunicorn's threads per worker.
+_LOOKUP_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="resume-lookup")
+
+
+def _start_resume_id_lookup(document_url, user_id):
+    """
+    Starts _lookup_resume_id on the lookup pool so it overlaps the Xano call.
+    Returns a zero-argument callable yielding the id; runs the lookup inline if the pool is shut down.
+    """
+    app = current_app._get_current_object()
+
+    def lookup():
+        with app.app_context():
+            return _lookup_resume_id(document_url, user_id)
+
+    try:
+        return _LOOKUP_EXECUTOR.submit(lookup).result
+    except RuntimeError:
+        # Interpreter shutdown: the executor no longer accepts work.
+        return lookup
+
 @resume_analyze_bp.route("/analyze-resume", methods=["POST","OPTIONS"])
 @require_authentication
 @check_and_use_feature('resume')
 def analyze_resume():
-    current_user_id = str(g.user.id)
+    current_user_id = g.user.id
     user_name = g.user.user_metadata.get('name') or \
                 g.user.user_metadata.get('display_name') or \
                 g.user.email or current_user_id
@@ -34,25 +105,15 @@ def analyze_resume():
             "additional_comments": additional_comment_text
         }
 
-        xano_response = requests.post(xano_api_url_resume_analyze, json=xano_payload, timeout=180)
+        # The resume_id lookup does not depend on the analysis, so run it while Xano works.
+        resume_id_result = _start_resume_id_lookup(current_resume_url, current_user_id)
+
+        xano_response = SESSION.post(xano_api_url_resume_analyze, json=xano_payload, timeout=_XANO_TIMEOUT)
         xano_response.raise_for_status()
         xano_data = xano_response.json() 
 
-        resume_id_from_db = None
-        try:
-            doc_query = extensions.supabase.table("user_documents") \
-                .select("id") \
-                .eq("document_url", current_resume_url) \
-                .eq("uid", current_user_id) \
-                .single() \
-                .execute()
-            if doc_query.data and doc_query.data.get("id"):
-                resume_id_from_db = doc_query.data.get("id")
-            else:
-                current_app.logger.warning(f"Warning: Could not find resume_id for URL: {current_resume_url} and user: {current_user_id}")
-        except Exception as e:
-            current_app.logger.error(f"Error querying for resume_id: {str(e)}")
-           
+        resume_id_from_db = resume_id_result()
+
         db_payload = {
             "user_id": current_user_id,
             "user_name": user_name,
@@ -64,13 +125,9 @@ def analyze_resume():
             "resume_id": resume_id_from_db 
         }
 
-
-        try:
-            insert_response = extensions.supabase.table("analyze_resume").insert(db_payload).execute()
-            if not insert_response.data:
-                current_app.logger.warning(f"Warning: Supabase insert into analyze_resume may have failed or returned no data. Response: {insert_response}")
-        except Exception as e:
-            current_app.logger.error(f"Error inserting into analyze_resume table: {str(e)}")
+        # The client only needs Xano's analysis, so persist it off the request path.
+        _analyze_resume_writer.put(db_payload)
+        _evict_analyses([db_payload])
 
         return jsonify(xano_data), xano_response.status_code
 
@@ -83,24 +140,57 @@ def analyze_resume():
     except requests.exceptions.RequestException as req_err:
         return jsonify({"error": "Request to Xano API failed", "details": str(req_err)}), 500
     except Exception as e:
-        current_app.logger.error(f"A FATAL UNHANDLED EXCEPTION occurred in analyze_resume: {e}", exc_info=True)
+        current_app.logger.error("A FATAL UNHANDLED EXCEPTION occurred in analyze_resume: %s", e, exc_info=True)
         return jsonify({"error": "An unexpected error occurred", "details": str(e)}), 500
 
 @resume_analyze_bp.route("/get-analyze-resume", methods=["GET", "OPTIONS"])
 @require_authentication
 def get_analyze_resume():
-    current_user_id = str(g.user.id)
+    supabase = current_app.extensions["supabase"]
+    current_user_id = g.user.id
+
+    cached = _ANALYSES_CACHE.get(current_user_id)
+    if cached is None:
+        generation = _ANALYSES_CACHE.token(current_user_id)
+        try:
+            query_response = supabase.table("analyze_resume") \
+                .select(_ANALYSES_COLUMNS) \
+                .eq("user_id", current_user_id) \
+                .order("created_at", desc=True) \
+                .limit(_ANALYSES_LIMIT) \
+                .execute()
+        except Exception as e:
+            current_app.logger.error("Error fetching from analyze_resume table: %s", e)
+            return jsonify({"error": f"Could not retrieve analyzed resume data: {str(e)}"}), 500
+        body = orjson.dumps(query_response.data or [])
+        cached = (body, hashlib.blake2b(body, digest_size=16).hexdigest())
+        _ANALYSES_CACHE.put(current_user_id, generation, cached)
+
+    body, etag = cached
+    response = current_app.response_class(body, mimetype="application/json")
+    response.set_etag(etag)
+    # Answers 304 with no body when the client's If-None-Match still matches.
+    return response.make_conditional(request)
+
+
+@resume_analyze_bp.route("/analyze-resume/<int:analysis_id>", methods=["GET", "OPTIONS"])
+@require_authentication
+def get_analyze_resume_detail(analysis_id):
+    supabase = current_app.extensions["supabase"]
+    current_user_id = g.user.id
 
     try:
-        query_response = extensions.supabase.table("analyze_resume") \
+        query_response = supabase.table("analyze_resume") \
             .select("*") \
+            .eq("id", analysis_id) \
             .eq("user_id", current_user_id) \
+            .limit(1) \
             .execute()
-
-        return jsonify(query_response.data or []), 200
-        
+        if not query_response.data:
+            return jsonify({"error": "Resume analysis not found"}), 404
+        return jsonify(query_response.data[0]), 200
     except Exception as e:
-        current_app.logger.error(f"Error fetching from analyze_resume table: {str(e)}")
+        current_app.logger.error("Error fetching analyze_resume %s: %s", analysis_id, e)
         return jsonify({"error": f"Could not retrieve analyzed resume data: {str(e)}"}), 500
         
 
@@ -108,7 +198,8 @@ def get_analyze_resume():
 @require_authentication
 @check_and_use_feature('resume')
 def roast_resume():
-    current_user_id = str(g.user.id)
+    supabase = current_app.extensions["supabase"]
+    current_user_id = g.user.id
     user_name = g.user.user_metadata.get('name') or \
                 g.user.user_metadata.get('display_name') or \
                 g.user.email or current_user_id
@@ -118,6 +209,7 @@ def roast_resume():
 
     resume_url_for_xano = None
     resume_id_from_db = None
+    resume_id_result = None
     
     try:
         current_resume_url_form = request.form.get("current_resume_url")
@@ -127,27 +219,29 @@ def roast_resume():
             if file_to_upload.filename == "":
                 return jsonify({"error": "No selected file for upload"}), 400
 
-            file_bytes = file_to_upload.read()
-            file_to_upload.seek(0)
+            # Only the head is needed for type sniffing; the body is streamed to storage below.
+            file_head = sniff_head(file_to_upload)
 
             flask_mimetype = file_to_upload.mimetype
             final_content_type_for_storage = flask_mimetype
 
             if flask_mimetype != 'application/pdf':
                 try:
-                    magic_mimetype = magic.from_buffer(file_bytes, mime=True)
+                    magic_mimetype = magic.from_buffer(file_head, mime=True)
                     final_content_type_for_storage = magic_mimetype
                 except Exception as e:
-                    current_app.logger.warning(f"Roast Resume: Error calling python-magic: {str(e)}. Falling back to Flask's mimetype: {flask_mimetype}")
+                    current_app.logger.warning("Roast Resume: Error calling python-magic: %s. Falling back to Flask's mimetype: %s", e, flask_mimetype)
             
-            file_storage_path = file_to_upload.filename 
+            # Same {uid}/{filename} layout as upload_document, so users cannot overwrite each
+            # other's files and delete_document can locate this one from its document_name.
+            file_storage_path = f"{current_user_id}/{file_to_upload.filename}"
 
-            extensions.supabase.storage.from_(SUPABASE_BUCKET).upload(
+            supabase.storage.from_(SUPABASE_BUCKET).upload(
                 file_storage_path,
-                file_bytes,
+                upload_body(file_to_upload),
                 file_options={"content-type": final_content_type_for_storage}
             )
-            resume_url_for_xano = extensions.supabase.storage.from_(SUPABASE_BUCKET).get_public_url(file_storage_path)
+            resume_url_for_xano = supabase.storage.from_(SUPABASE_BUCKET).get_public_url(file_storage_path)
 
 
             document_data = {
@@ -158,28 +252,17 @@ def roast_resume():
                 "display_name": user_name,
                 "document_comments": "Uploaded for resume roast"
             }
-            doc_insert_response = extensions.supabase.table("user_documents").insert(document_data).execute()
+            doc_insert_response = supabase.table("user_documents").insert(document_data).execute()
+            evict_user_documents(current_user_id)
             
             if doc_insert_response.data and len(doc_insert_response.data) > 0 and doc_insert_response.data[0].get("id"):
                 resume_id_from_db = doc_insert_response.data[0].get("id")
             else:
-                current_app.logger.warning(f"Warning: Could not get ID from user_documents insert for {resume_url_for_xano}. Response: {doc_insert_response}")
+                current_app.logger.warning("Could not get ID from user_documents insert for %s. Response: %s", resume_url_for_xano, doc_insert_response)
 
         elif current_resume_url_form:
             resume_url_for_xano = current_resume_url_form
-            try:
-                doc_query = extensions.supabase.table("user_documents") \
-                    .select("id") \
-                    .eq("document_url", resume_url_for_xano) \
-                    .eq("uid", current_user_id) \
-                    .single() \
-                    .execute()
-                if doc_query.data and doc_query.data.get("id"):
-                    resume_id_from_db = doc_query.data.get("id")
-                else:
-                    current_app.logger.warning(f"Warning: Could not find resume_id for existing URL: {resume_url_for_xano} and user: {current_user_id}")
-            except Exception as e:
-                current_app.logger.error(f"Error querying for resume_id for existing URL: {str(e)}")
+            resume_id_result = _start_resume_id_lookup(resume_url_for_xano, current_user_id)
         else:
             return jsonify({"error": "Missing resume input: provide 'current_resume_url' (form data) or upload a 'file' (multipart)"}), 400
 
@@ -187,10 +270,13 @@ def roast_resume():
              return jsonify({"error": "Failed to determine resume URL for processing"}), 500
 
         xano_payload = {"current_resume": resume_url_for_xano}
-        xano_response = requests.post(xano_api_url_resume_roast, json=xano_payload, timeout=180)
+        xano_response = SESSION.post(xano_api_url_resume_roast, json=xano_payload, timeout=_XANO_TIMEOUT)
         xano_response.raise_for_status()
         xano_data = xano_response.json()
 
+        if resume_id_result is not None:
+            resume_id_from_db = resume_id_result()
+
         feedback_content_for_db = xano_data  
 
         raw_feedback_payload = xano_data.get("feedback")
@@ -199,12 +285,12 @@ def roast_resume():
                 parsed_inner_json = json.loads(raw_feedback_payload)
                 feedback_content_for_db = parsed_inner_json
             except json.JSONDecodeError as e:
-                current_app.logger.warning(f"Roast Resume: Error decoding JSON string from 'feedback' key: {e}. Storing raw Xano response object instead.")
+                current_app.logger.warning("Roast Resume: Error decoding JSON string from 'feedback' key: %s. Storing raw Xano response object instead.", e)
             except TypeError: 
-                current_app.logger.warning(f"Roast Resume: Value for 'feedback' key was not a string (TypeError). Storing raw Xano response object.")
+                current_app.logger.warning("Roast Resume: Value for 'feedback' key was not a string (TypeError). Storing raw Xano response object.")
 
         elif raw_feedback_payload is not None: 
-            current_app.logger.warning(f"Roast Resume: 'feedback' key present but not a string. Using raw Xano response for feedback_analysis. Type: {type(raw_feedback_payload)}")
+            current_app.logger.warning("Roast Resume: 'feedback' key present but not a string. Using raw Xano response for feedback_analysis. Type: %s", type(raw_feedback_payload).__name__)
 
         db_payload = {
             "user_id": current_user_id,
@@ -217,12 +303,8 @@ def roast_resume():
             "resume_id": resume_id_from_db
         }
         
-        try:
-            insert_response = extensions.supabase.table("analyze_resume").insert(db_payload).execute()
-            if not insert_response.data:
-                current_app.logger.warning(f"Warning: Supabase insert into analyze_resume (roast) may have failed. Response: {insert_response}")
-        except Exception as e:
-            current_app.logger.error(f"Error inserting into analyze_resume table (roast): {str(e)}")
+        _analyze_resume_writer.put(db_payload)
+        _evict_analyses([db_payload])
 
         return jsonify(xano_data), xano_response.status_code
 
@@ -235,5 +317,5 @@ def roast_resume():
     except requests.exceptions.RequestException as req_err:
         return jsonify({"error": "Request to Xano API failed", "details": str(req_err)}), 500
     except Exception as e:
-        current_app.logger.error(f"Unexpected error in roast_resume: {str(e)}")
+        current_app.logger.error("Unexpected error in roast_resume: %s", e, exc_info=True)
         return jsonify({"error": "An unexpected error occurred", "details": str(e)}), 500
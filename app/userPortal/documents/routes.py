@@ -1,39 +1,34 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 import os
+import hashlib
 import magic
-from app import extensions
+import orjson
+from app.response_cache import ResponseCache
+from app.uploads import sniff_head, upload_body
+from app.userPortal.subscription.helpers import get_authenticated_user
 from . import upload_bp 
 
 SUPABASE_BUCKET = "user-documents"
 
+# Serialized /get-documents body per user with its ETag. A short TTL absorbs the
+# document picker's repeat reads; every write to user_documents evicts the user's entry
+# (see ResponseCache for the generation guard and per-process scope).
+_DOCUMENTS_CACHE = ResponseCache(maxsize=5000, ttl=30)
 
-def get_authenticated_user():
-    """Helper to extract and validate JWT token and return user ID."""
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        return None, jsonify({"error": "Missing or invalid Authorization header"}), 401
 
-    jwt_token = auth_header.split(" ")[1]
-    try:
-        user_response = extensions.supabase.auth.get_user(jwt=jwt_token)
-        user = user_response.user
-        if not user or not user.id:
-            return None, jsonify({"error": "Invalid token or user not found"}), 401
-        return user, None, None
-    except Exception as e:
-        return None, jsonify({"error": f"Authentication failed: {str(e)}"}), 401
+def evict_user_documents(uid):
+    """Drops the cached document list for uid; call after inserting, updating or deleting its rows."""
+    _DOCUMENTS_CACHE.evict(uid)
 
 
 @upload_bp.route("/upload-document", methods=["POST", "OPTIONS"])
 def upload_document():
-    if request.method == "OPTIONS":
-        return "", 204
-
+    supabase = current_app.extensions["supabase"]
     user, error_response, status = get_authenticated_user()
     if error_response:
         return error_response, status
 
-    current_user_id = str(user.id)
+    current_user_id = user.id
     user_display_name = user.user_metadata.get('name') or \
                         user.user_metadata.get('display_name') or \
                         user.email or current_user_id
@@ -45,8 +40,9 @@ def upload_document():
     if file.filename == "":
         return jsonify({"error": "No selected file"}), 400
 
-    file_bytes = file.read()
-  
+    # Only the head is needed for type sniffing; the body is streamed to storage below.
+    file_head = sniff_head(file)
+
     flask_mimetype = file.mimetype
 
     final_content_type_for_storage = flask_mimetype 
@@ -55,7 +51,7 @@ def upload_document():
         final_content_type_for_storage = 'application/pdf'
     else:
         try:
-            magic_mimetype = magic.from_buffer(file_bytes, mime=True)
+            magic_mimetype = magic.from_buffer(file_head, mime=True)
             final_content_type_for_storage = magic_mimetype
         except Exception as e:
             print(f"Upload: Error calling python-magic: {str(e)}. Falling back to Flask's mimetype: {flask_mimetype}")
@@ -67,15 +63,15 @@ def upload_document():
     document_comments = request.form.get("document_comments", "").strip()
 
     try:
-        extensions.supabase.storage.from_(SUPABASE_BUCKET).upload(
+        supabase.storage.from_(SUPABASE_BUCKET).upload(
             storage_file_path,  # Use the unique path for storage
-            file_bytes,
+            upload_body(file),
             file_options={
                 "content-type": final_content_type_for_storage,
                 "content-disposition": f'inline; filename="{file.filename}"'
             }
         )
-        public_url = extensions.supabase.storage.from_(SUPABASE_BUCKET).get_public_url(storage_file_path) # Get URL based on unique path
+        public_url = supabase.storage.from_(SUPABASE_BUCKET).get_public_url(storage_file_path) # Get URL based on unique path
 
         document_data = {
             "uid": current_user_id,
@@ -86,7 +82,8 @@ def upload_document():
             "document_comments": document_comments
         }
 
-        data, _ = extensions.supabase.table("user_documents").insert(document_data).execute()
+        data, _ = supabase.table("user_documents").insert(document_data).execute()
+        evict_user_documents(current_user_id)
         return jsonify({"message": "File uploaded", "file_url": public_url, "db_response": data}), 201
 
     except Exception as e:
@@ -95,81 +92,69 @@ def upload_document():
 
 @upload_bp.route("/get-documents", methods=["GET", "OPTIONS"])
 def get_documents():
-    if request.method == "OPTIONS":
-        return "", 204
-
+    supabase = current_app.extensions["supabase"]
     user, error_response, status = get_authenticated_user()
     if error_response:
         return error_response, status
 
-    try:
-        response = extensions.supabase.table("user_documents") \
-            .select("id, document_name, document_type, document_url, created_at, display_name, document_comments") \
-            .eq("uid", str(user.id)) \
-            .execute()
-
-        return jsonify(response.data or []), 200
+    cached = _DOCUMENTS_CACHE.get(user.id)
+    if cached is None:
+        generation = _DOCUMENTS_CACHE.token(user.id)
+        try:
+            response = supabase.table("user_documents") \
+                .select("id, document_name, document_type, document_url, created_at, display_name, document_comments") \
+                .eq("uid", user.id) \
+                .execute()
+        except Exception as e:
+            print(f"Fetch error: {str(e)}")
+            return jsonify({"error": f"Could not retrieve documents: {str(e)}"}), 500
+        body = orjson.dumps(response.data or [])
+        cached = (body, hashlib.blake2b(body, digest_size=16).hexdigest())
+        _DOCUMENTS_CACHE.put(user.id, generation, cached)
 
-    except Exception as e:
-        print(f"Fetch error: {str(e)}")
-        return jsonify({"error": f"Could not retrieve documents: {str(e)}"}), 500
+    body, etag = cached
+    response = current_app.response_class(body, mimetype="application/json")
+    response.set_etag(etag)
+    # Answers 304 with no body when the client's If-None-Match still matches.
+    return response.make_conditional(request)
 
 
 @upload_bp.route("/delete-document/<int:document_id>", methods=["DELETE", "OPTIONS"])
 def delete_document(document_id):
-    if request.method == "OPTIONS":
-        return "", 204
-
+    supabase = current_app.extensions["supabase"]
     user, error_response, status = get_authenticated_user()
     if error_response:
         return error_response, status
     
-    current_user_id = str(user.id)
+    current_user_id = user.id
 
     try:
-        # First, retrieve the document to verify existence and ownership, and to get its name for storage deletion
-        select_response = extensions.supabase.table("user_documents") \
-            .select("document_name") \
+        # One round-trip: the uid filter enforces ownership and PostgREST returns the
+        # deleted row, which carries the name needed to remove the stored file.
+        delete_db_response = supabase.table("user_documents") \
+            .delete() \
             .eq("id", document_id) \
             .eq("uid", current_user_id) \
-            .execute() # Removed .single()
+            .execute()
 
-        if not select_response.data:
+        if not delete_db_response.data:
             return jsonify({"error": "Document not found or you do not have permission to delete it."}), 404
+        evict_user_documents(current_user_id)
 
-        document_name_from_db = select_response.data[0]["document_name"]
+        document_name_from_db = delete_db_response.data[0]["document_name"]
         # Construct the correct storage path using user ID and the document name from DB
         file_path_in_storage = f"{current_user_id}/{document_name_from_db}"
 
-        # 1. Attempt to delete from Supabase Storage
         try:
-            storage_remove_result = extensions.supabase.storage.from_(SUPABASE_BUCKET).remove([file_path_in_storage])
+            storage_remove_result = supabase.storage.from_(SUPABASE_BUCKET).remove([file_path_in_storage])
             # Check if there was an error removing the specific file from storage
             if storage_remove_result and storage_remove_result.data:
                 item_status = next((item for item in storage_remove_result.data if item.get('name') == file_path_in_storage), None)
                 if item_status and item_status.get('error'):
                     print(f"Warning: Supabase storage could not delete file '{file_path_in_storage}'. Error: {item_status.get('error')}")
-                    # Depending on policy, you might want to make this a hard stop or just log and continue.
         except Exception as storage_err:
+            # The metadata row is already gone, so the document is deleted from the user's point of view.
             print(f"Error during Supabase storage file removal for '{file_path_in_storage}': {str(storage_err)}")
-            # Depending on policy, may return error here.
-
-        # 2. Delete document metadata from the user_documents table
-        delete_db_response = extensions.supabase.table("user_documents") \
-            .delete() \
-            .eq("id", document_id) \
-            .eq("uid", current_user_id) \
-            .execute()
-
-        # Check if the database deletion was successful (i.e., if data was returned)
-        if not delete_db_response.data:
-            # This could happen if the record was deleted by another process between the select and delete,
-            # or if there's a policy preventing deletion not caught by the initial select.
-            print(f"Warning: Document with id {document_id} for user {current_user_id} was not deleted from DB (it might have been already deleted or a policy prevented it).")
-            # Consider if a 404 is more appropriate if the record is already gone.
-            # For now, let's assume if we got here, the aim was to delete, and if it's gone, that's acceptable.
-            # If an error needs to be raised, a 500 might be too generic if the record is just already gone.
-            # However, if select_response.data was populated, delete_db_response.data should also be.
 
         return jsonify({"message": "Document deleted successfully"}), 200
 
@@ -180,21 +165,12 @@ def delete_document(document_id):
 
 @upload_bp.route("/update-document-comments/<int:document_id>", methods=["PATCH"])
 def update_document_comments(document_id):
+    supabase = current_app.extensions["supabase"]
     user, error_response, status = get_authenticated_user()
     if error_response:
         return error_response, status
 
     try:
-        check_response = extensions.supabase.table("user_documents") \
-            .select("id") \
-            .eq("id", document_id) \
-            .eq("uid", str(user.id)) \
-            .single() \
-            .execute()
-
-        if not check_response.data:
-            return jsonify({"error": "Not found or unauthorized"}), 404
-
         request_data = request.get_json()
 
         if request_data is None:
@@ -202,11 +178,15 @@ def update_document_comments(document_id):
         
         new_comment = request_data.get("comment", "").strip()
 
-        update_response = extensions.supabase.table("user_documents") \
+        update_response = supabase.table("user_documents") \
             .update({"document_comments": new_comment}) \
             .eq("id", document_id) \
-            .eq("uid", str(user.id)) \
+            .eq("uid", user.id) \
             .execute()
+        # The uid filter enforces ownership; no row back means not found or not the caller's.
+        if not update_response.data:
+            return jsonify({"error": "Not found or unauthorized"}), 404
+        evict_user_documents(user.id)
 
         return jsonify({"message": "Comment updated", "data": update_response.data}), 200
 
@@ -1,8 +1,15 @@
 from datetime import date, datetime, timedelta
-from flask import jsonify, g, request, current_app, make_response
-from app import extensions 
-from functools import wraps
+from flask import jsonify, g, request, current_app
+from functools import lru_cache, wraps
 import calendar
+import hashlib
+import threading
+import time
+import jwt
+import orjson
+from cachetools import TTLCache
+from dataclasses import dataclass
+from typing import Optional
 from postgrest.exceptions import APIError
 from gotrue.errors import AuthApiError
 
@@ -10,49 +17,203 @@ from gotrue.errors import AuthApiError
 class QuotaExceededError(Exception):
     pass
 
+@dataclass(frozen=True, slots=True)
+class AuthUser:
+    """The subset of the gotrue User object that routes read from g.user, built from JWT claims."""
+    id: str
+    email: Optional[str]
+    user_metadata: dict
+
+def _user_from_claims(claims):
+    return AuthUser(
+        id=claims['sub'],
+        email=claims.get('email'),
+        user_metadata=claims.get('user_metadata') or {},
+    )
+
+# One PyJWKClient per Supabase project; it caches the fetched key set and keys.
+_JWKS_CLIENTS = {}
+# The JWKS fetch holds the client's lock on the request thread, so keep it short
+# and let callers fall back to GoTrue rather than queue behind PyJWT's 30 s default.
+_JWKS_FETCH_TIMEOUT = 3
+
+def _jwks_client():
+    supabase_url = current_app.config.get("SUPABASE_URL")
+    if not supabase_url:
+        return None
+    client = _JWKS_CLIENTS.get(supabase_url)
+    if client is None:
+        jwks_url = f"{supabase_url.rstrip('/')}/auth/v1/.well-known/jwks.json"
+        client = _JWKS_CLIENTS.setdefault(supabase_url, jwt.PyJWKClient(jwks_url, cache_keys=True, timeout=_JWKS_FETCH_TIMEOUT))
+    return client
+
+def verify_supabase_jwt(jwt_token):
+    """
+    Verifies a Supabase access token locally and returns a user object built from
+    its claims, avoiding a GoTrue round-trip. HS256 tokens are checked against
+    SUPABASE_JWT_SECRET; asymmetric (RS256/ES256) tokens against the project's JWKS.
+    Returns None when the token can't be checked locally (no secret configured,
+    unknown key id, JWKS unavailable) so callers can fall back to auth.get_user.
+    Raises jwt.InvalidTokenError (including ExpiredSignatureError) for bad tokens.
+    """
+    options = {"require": ["exp", "sub"]}
+    if jwt.get_unverified_header(jwt_token).get("alg") == "HS256":
+        secret = current_app.config.get("SUPABASE_JWT_SECRET")
+        if not secret:
+            return None
+        claims = jwt.decode(
+            jwt_token,
+            secret,
+            algorithms=["HS256"],
+            audience="authenticated",
+            options=options,
+        )
+        return _user_from_claims(claims)
+
+    jwks_client = _jwks_client()
+    if jwks_client is None:
+        return None
+    try:
+        signing_key = jwks_client.get_signing_key_from_jwt(jwt_token)
+    except jwt.PyJWKClientError as e:
+        current_app.logger.warning("Local JWT verification unavailable, falling back to GoTrue: %s", e)
+        return None
+    claims = jwt.decode(
+        jwt_token,
+        signing_key.key,
+        algorithms=["RS256", "ES256"],
+        audience="authenticated",
+        issuer=f"{current_app.config['SUPABASE_URL'].rstrip('/')}/auth/v1",
+        options=options,
+    )
+    return _user_from_claims(claims)
+
+@lru_cache(maxsize=64)
+def _error_body(message):
+    return orjson.dumps({"error": message})
+
+def error_response(message, status):
+    """
+    Builds a JSON {"error": message} response from pre-encoded bytes. For the fixed
+    messages returned on hot failure paths (bad or expired tokens); a fresh Response
+    is still created each time because after_request hooks mutate its headers.
+    """
+    return current_app.response_class(_error_body(message), status=status, mimetype="application/json")
+
+def normalize_user_id(user):
+    """Ensures user.id is a str once at auth time so routes can use it directly."""
+    if not isinstance(user.id, str):
+        user.id = str(user.id)
+    return user
+
+# Users resolved from access tokens, shared by require_authentication and the
+# document routes. Keyed by a digest of the token so raw JWTs are never held in
+# memory; entries also carry the token's own expiry. The short TTL bounds how
+# long a session revoked in Supabase keeps working here.
+_USER_CACHE = TTLCache(maxsize=20_000, ttl=60)
+_USER_CACHE_LOCK = threading.RLock()
+
+def _token_cache_key(jwt_token):
+    return hashlib.blake2b(jwt_token.encode(), digest_size=16).digest()
+
+def _token_expiry(jwt_token):
+    """Reads the exp claim without verifying; only used to bound cache lifetime."""
+    try:
+        return jwt.decode(jwt_token, options={"verify_signature": False}).get("exp")
+    except jwt.InvalidTokenError:
+        return None
+
+def cached_user(jwt_token):
+    """Returns the user for a token resolved within the cache TTL and not yet expired, else None."""
+    with _USER_CACHE_LOCK:
+        cached = _USER_CACHE.get(_token_cache_key(jwt_token))
+    if cached and cached[1] > time.time():
+        return cached[0]
+    return None
+
+def resolve_user(jwt_token):
+    """
+    Returns the user for an access token, or None if Supabase returned no user.
+    Served from the token cache when possible; otherwise verified locally (or via
+    GoTrue when no JWT secret is configured). Failures raise and are never cached.
+    """
+    user = cached_user(jwt_token)
+    if user is not None:
+        return user
+
+    user = verify_supabase_jwt(jwt_token)
+    if user is None:
+        user = current_app.extensions["supabase"].auth.get_user(jwt_token).user
+    if not user or not user.id:
+        return None
+    normalize_user_id(user)
+
+    expires_at = _token_expiry(jwt_token)
+    if expires_at:
+        with _USER_CACHE_LOCK:
+            _USER_CACHE[_token_cache_key(jwt_token)] = (user, expires_at)
+    return user
+
+def get_authenticated_user():
+    """
+    Helper for routes that authenticate inline instead of via @require_authentication.
+    Returns (user, None, None) on success or (None, error_response, status) on failure.
+    """
+    auth_header = request.headers.get("Authorization")
+    if not auth_header or not auth_header.startswith("Bearer "):
+        return None, error_response("Missing or invalid Authorization header", 401), 401
+
+    jwt_token = auth_header.split(" ")[1]
+    try:
+        user = resolve_user(jwt_token)
+        if user is None:
+            return None, error_response("Invalid token or user not found", 401), 401
+    except (jwt.InvalidTokenError, AuthApiError) as e:
+        # Expected for expired, tampered or revoked tokens; no traceback needed.
+        current_app.logger.warning("Authentication failed: %s", e)
+        return None, jsonify({"error": f"Authentication failed: {str(e)}"}), 401
+    except Exception as e:
+        current_app.logger.error("Unexpected error during authentication: %s", e, exc_info=True)
+        return None, jsonify({"error": f"Authentication failed: {str(e)}"}), 401
+
+    return user, None, None
+
 def require_authentication(f):
     """
-    Decorator to protect routes, set g.user, and handle CORS preflight requests.
-    - This decorator now creates a full, self-contained response for OPTIONS requests
-      to ensure CORS preflights succeed before the main app logic is hit.
+    Decorator to protect routes and set g.user.
+    CORS preflights never reach it: the app-level before_request hook answers
+    OPTIONS requests before blueprint dispatch.
     """
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        # Manually handle CORS preflight requests.
-        # This is necessary because this decorator runs before the main Flask-CORS extension.
-        if request.method == 'OPTIONS':
-            response = make_response()
-            
-            # The browser needs to know which origin is allowed to make the request.
-            # We reflect the request's Origin header, which is standard and secure practice.
-            # The app-level Flask-CORS config will still validate this origin on the actual request.
-            origin = request.headers.get('Origin')
-            if origin:
-                response.headers.add('Access-Control-Allow-Origin', origin)
-            
-            # Specify what headers and methods are allowed in the actual request.
-            response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
-            response.headers.add('Access-Control-Allow-Methods', 'GET,POST,PUT,DELETE,OPTIONS,PATCH')
-            response.headers.add('Access-Control-Allow-Credentials', 'true')
-            return response, 200
-
         auth_header = request.headers.get("Authorization", "")
         if not auth_header.startswith("Bearer "):
-            current_app.logger.warning(f"Bad or missing Authorization header received: {auth_header!r}")
-            return jsonify({"error": "Missing or malformed Authorization header"}), 401
+            current_app.logger.warning("Bad or missing Authorization header received.")
+            return error_response("Missing or malformed Authorization header", 401)
 
         jwt_token = auth_header.split(" ", 1)[1]
+        # A token seen within the cache TTL was already fully validated; skip straight to the view.
+        user = cached_user(jwt_token)
+        if user is not None:
+            g.user = user
+            return f(*args, **kwargs)
+
         if not jwt_token or len(jwt_token.split(".")) != 3:
-            current_app.logger.warning(f"Malformed JWT received: {jwt_token!r}")
-            return jsonify({"error": "Invalid token format"}), 401
+            current_app.logger.warning("Malformed JWT received (%d chars).", len(jwt_token))
+            return error_response("Invalid token format", 401)
 
         try:
-            user_response = extensions.supabase.auth.get_user(jwt_token)
-            user = user_response.user
-            if not user or not user.id:
+            user = resolve_user(jwt_token)
+            if user is None:
                 raise ValueError("Supabase did not return a user object in the response.")
             g.user = user
 
+        except jwt.ExpiredSignatureError:
+            current_app.logger.warning("Authentication failed with expired JWT.")
+            return error_response("Your session has expired. Please log in again.", 401)
+        except jwt.InvalidTokenError as e:
+            current_app.logger.warning(f"Authentication failed with invalid JWT: {e}")
+            return jsonify({"error": "Invalid token", "details": str(e)}), 401
         except AuthApiError as e:
             # This specific error means the user's JWT is valid but the session/user
             # is not found on Supabase side (e.g., user deleted, session logged out).
@@ -62,7 +223,8 @@ def require_authentication(f):
         except APIError as e:
             current_app.logger.error(f"Authentication API call failed: {e}", exc_info=True)
             error_details = e.message if isinstance(e.message, dict) else str(e.message)
-            status_code = getattr(e, 'status', 401) 
+            status = getattr(e, 'status', None)
+            status_code = status if isinstance(status, int) and 100 <= status <= 599 else 401
             return jsonify({"error": "Authentication failed", "details": error_details}), status_code
         except Exception as e:
             current_app.logger.error(f"An unexpected exception occurred during authentication: {e}", exc_info=True)
@@ -80,10 +242,11 @@ def get_last_day_of_month(dt):
 
 def get_user_display_name(user):
     """Safely retrieves the display name from a user object."""
-    if not user or not hasattr(user, 'user_metadata') or not user.user_metadata:
+    metadata = getattr(user, 'user_metadata', None) if user else None
+    if not metadata:
         return 'N/A'
     # Prioritize 'full_name', then 'name', and finally 'N/A'
-    return user.user_metadata.get('full_name') or user.user_metadata.get('name') or 'N/A'
+    return metadata.get('full_name') or metadata.get('name') or 'N/A'
 
 def get_next_period(current_period_end):
     """Calculates the start and end of the next billing period."""
@@ -137,12 +300,12 @@ def check_and_use_feature(feature_name, increment_by=1):
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
-            if not hasattr(g, 'user'):
+            if 'user' not in g:
                 current_app.logger.error("g.user not found. @require_authentication must be used before @check_and_use_feature.")
                 return jsonify({"error": "Internal server error: user not authenticated for feature check."}), 500
 
             try:
-                supabase = extensions.supabase
+                supabase = current_app.extensions["supabase"]
                 uid = g.user.id
                 display_name = get_user_display_name(g.user)
                 
@@ -4,7 +4,6 @@ from datetime import datetime, date, timedelta, timezone
 import stripe
 from dateutil.relativedelta import relativedelta
 from . import subscription_bp
-from app import extensions
 from .helpers import check_and_use_feature, get_last_day_of_month, require_authentication
 from postgrest.exceptions import APIError
 from types import SimpleNamespace
@@ -17,7 +16,7 @@ def get_subscription_status():
     Endpoint for the frontend to get the user's full subscription and usage status.
     Relies on the `handle_new_user` database trigger to provision new users.
     """
-    supabase = extensions.supabase
+    supabase = current_app.extensions["supabase"]
     uid = g.user.id
 
     try:
@@ -80,7 +79,7 @@ def create_customer_portal_session():
     if not stripe.api_key:
         return jsonify({"error": "This feature is not configured on the server."}), 503
 
-    supabase = extensions.supabase
+    supabase = current_app.extensions["supabase"]
     uid = g.user.id
 
     try:
@@ -134,7 +133,7 @@ def get_invoices():
     if not stripe.api_key:
         return jsonify({"error": "This feature is not configured on the server."}), 503
 
-    supabase = extensions.supabase
+    supabase = current_app.extensions["supabase"]
     uid = g.user.id
 
     try:
@@ -166,7 +165,7 @@ def cancel_subscription():
     if not stripe.api_key:
         return jsonify({"error": "This feature is not configured on the server."}), 503
 
-    supabase = extensions.supabase
+    supabase = current_app.extensions["supabase"]
     uid = g.user.id
 
     try:
@@ -214,7 +213,7 @@ def reactivate_subscription():
     if not stripe.api_key:
         return jsonify({"error": "This feature is not configured on the server."}), 503
 
-    supabase = extensions.supabase
+    supabase = current_app.extensions["supabase"]
     uid = g.user.id
 
     try:
@@ -266,7 +265,7 @@ def stripe_webhook():
         
     payload = request.data
     sig_header = request.headers.get('Stripe-Signature')
-    supabase = extensions.supabase
+    supabase = current_app.extensions["supabase"]
 
     try:
         event = stripe.Webhook.construct_event(payload=payload, sig_header=sig_header, secret=stripe_webhook_secret)
@@ -372,7 +371,7 @@ def test_db_write():
     It attempts a single UPSERT operation. If this fails, it proves that
     the network environment is blocking POST/PATCH requests to Supabase.
     """
-    supabase = extensions.supabase
+    supabase = current_app.extensions["supabase"]
     uid = g.user.id
     current_app.logger.info(f"--- DIAGNOSTIC: Testing database WRITE for user {uid} ---")
     